@@ -1,4 +1,4 @@
-import io, asyncio, json, os
+import asyncio, json, os
 from datetime import datetime
 from uuid import uuid4, UUID
 from typing import Annotated, Optional
@@ -101,9 +101,9 @@ async def upload_file_to_bucket(file: Annotated[UploadFile, File()], db: DBSessi
             "files",
             **asdict(FileModel(name=name, bucketname=PRIMARY_BUCKET)),
         )
-        out_file = io.BytesIO(await file.read())
-        out_file.name = file.filename
-        await upload_file(out_file)
+        # the spooled upload (on disk past 1 MiB) is streamed to the bucket in
+        # chunks from a worker thread instead of being copied into memory first
+        await upload_file(file.file, filename=file.filename)
     return FileResponse(
         type=file.content_type,
         filename=file.filename,
@@ -138,9 +138,24 @@ async def delete_file_from_bucket(file_id: int, db: DBSession):
     bucketname = row.get("bucketname") or PRIMARY_BUCKET
     async with db.transaction():
         try:
+            # downloads are content-addressed, so several rows can point at one object;
+            # the lock keeps a row for this name from being added while we check
+            await db.execute("SELECT pg_advisory_xact_lock(hashtext($1))", name)
             # lets try to delete from db first as if s3 upload issue then db will be automatically rolledback
             await db_delete(db, "files", id=file_id)
-            await s3_delete_file(name, bucketname)
+            shared = await db.fetchval(
+                """
+                SELECT EXISTS(
+                    SELECT 1 FROM files
+                    WHERE name = $1 AND COALESCE(bucketname, $3) = $2
+                )
+                """,
+                name,
+                bucketname,
+                PRIMARY_BUCKET,
+            )
+            if not shared:
+                await s3_delete_file(name, bucketname)
         except Exception:
             raise HTTPException(
                 status_code=500, detail="Error occured while deleting the file"
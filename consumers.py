@@ -1,4 +1,5 @@
 from modules.worker import WorkerPool
+from modules.video_downloader import flush_download_records
 
 
 class ConsumerManager:
@@ -16,6 +17,8 @@ class ConsumerManager:
         if not self._started:
             return
         await self._pool.stop()
+        # download rows are written in the background; don't exit with some queued
+        await flush_download_records()
         self._started = False
 
 
@@ -46,5 +49,7 @@ async def start_consumers(workers=3):
 
 if __name__ == "__main__":
     import asyncio
+    from modules.video_processor import install_uvloop
 
+    install_uvloop()
     asyncio.run(start_consumers())
@@ -74,9 +74,8 @@ async def main():
     #     ),
     # )
 
-    result = bytearray()
-    async for chunk in processor.add_text(input_path, segments):
-        result.extend(chunk)
+    parts = [chunk async for chunk in processor.add_text(input_path, segments)]
+    result = b"".join(parts)
 
     with open(output_path, "wb") as f:
         f.write(result)
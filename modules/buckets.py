@@ -31,14 +31,12 @@ async def load_buckets():
 async def create_bucket(bucketname: str):
     client = get_client()
     try:
-        await asyncio.to_thread(
-            lambda a: client.head_bucket(Bucket=bucketname), bucketname
-        )
+        await asyncio.to_thread(client.head_bucket, Bucket=bucketname)
         return True
     except botocore.exceptions.ClientError as e:
         error_code = int(e.response["Error"]["Code"])
         if error_code == 404:
-            await asyncio.to_thread(lambda a: client.create_bucket(Bucket=bucketname))
+            await asyncio.to_thread(client.create_bucket, Bucket=bucketname)
             return True
     return False
 
@@ -51,15 +49,39 @@ async def upload_file(
     if hasattr(file, "seek"):
         file.seek(0)
     await asyncio.to_thread(
-        lambda: client.upload_fileobj(
-            file,
-            bucketname,
-            filename if filename else (file.name if hasattr(file, "name") else None),
-        )
+        client.upload_fileobj,
+        file,
+        bucketname,
+        filename if filename else (file.name if hasattr(file, "name") else None),
     )
     return True
 
 
+async def upload_path(
+    path: str, bucketname: str = PRIMARY_BUCKET, filename: str = None
+):
+    """Upload a local file; boto3 opens and streams it inside the worker thread."""
+    client = get_client()
+    await asyncio.to_thread(
+        client.upload_file,
+        path,
+        bucketname,
+        filename if filename else os.path.basename(path),
+    )
+    return True
+
+
+async def object_exists(filename: str, bucketname: str = PRIMARY_BUCKET) -> bool:
+    client = get_client()
+    try:
+        await asyncio.to_thread(client.head_object, Bucket=bucketname, Key=filename)
+        return True
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
 def get_url(filename: str, bucketname: str, upload=False):
     # https://stackoverflow.com/questions/65198959/aws-s3-generate-presigned-url-vs-generate-presigned-post-for-uploading-files
     # put_object for upload
@@ -111,6 +133,4 @@ def get_filename_from_url(url: str) -> str:
 async def delete_file(filename: str, bucketname: str = PRIMARY_BUCKET) -> None:
     """Remove object from S3. No-op if object does not exist."""
     client = get_client()
-    await asyncio.to_thread(
-        lambda: client.delete_object(Bucket=bucketname, Key=filename)
-    )
+    await asyncio.to_thread(client.delete_object, Bucket=bucketname, Key=filename)
@@ -33,14 +33,14 @@ CONDITION = Literal["AND", "OR"]
 TABLE = Literal["buckets", "files", "jobs", "workflows", "downloads"]
 
 
-@dataclass
+@dataclass(slots=True)
 class Bucket:
     id: Optional[int] = field(init=False, default=-1)
     name: str
     created_at: datetime = datetime.now()
 
 
-@dataclass
+@dataclass(slots=True)
 class File:
     id: Optional[int] = field(init=False, default=-1)
     name: str
@@ -63,7 +63,7 @@ class Job(BaseModel):
     error: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class OutputFile:
     filename: str
     video_format: str
@@ -71,7 +71,7 @@ class OutputFile:
     audio_bitrate: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Download:
     id: Optional[int] = field(init=False, default=-1)
     youtube_url: str
@@ -227,6 +227,16 @@ async def create_many(
     return []
 
 
+async def copy_many(db: asyncpg.Connection, table: TABLE, records: list[dict]) -> int:
+    """Bulk insert through the COPY protocol (one round-trip). Returns rows written."""
+    if not records:
+        return 0
+    columns = [k for k in records[0].keys() if k != "id"]
+    rows = [tuple(rec[k] for k in columns) for rec in records]
+    await db.copy_records_to_table(table, records=rows, columns=columns)
+    return len(rows)
+
+
 async def read(
     db: asyncpg.Connection,
     table: TABLE,
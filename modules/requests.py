@@ -11,6 +11,7 @@ from .video_processor import (
     TranscodeOptions,
 )
 from .video_downloader import YouTubeDownloadOptions
+from dataclasses import asdict, is_dataclass
 from datetime import datetime
 
 
@@ -18,6 +19,8 @@ def _to_data_dict(obj: Any) -> Any:
     """Convert model to dict for JSON; leave dict/list as-is."""
     if hasattr(obj, "model_dump"):
         return obj.model_dump()
+    if is_dataclass(obj):
+        return asdict(obj)
     return obj
 
 
@@ -1,28 +1,233 @@
 import asyncio
+import hashlib
 import os
+import shutil
 import tempfile
+from collections import deque
 from datetime import datetime
-from io import BytesIO
 from typing import Optional, Union
-from uuid import uuid4
 
 import yt_dlp
 import asyncpg
 
-from .buckets import PRIMARY_BUCKET, get_url, upload_file
+from .buckets import PRIMARY_BUCKET, get_url, object_exists, upload_path
 from .logger import logger
-from .db import create as db_create, read as db_read, File as BucketFileModel
-from dataclasses import asdict
-from pydantic import BaseModel
+from .db import (
+    copy_many as db_copy_many,
+    create as db_create,
+    get_db,
+    read as db_read,
+    File as BucketFileModel,
+)
+from dataclasses import asdict, dataclass, fields
+
+# Threads given to each ffmpeg postprocessor yt-dlp spawns; downloads are gated so
+# that concurrent ffmpeg processes fill the cores without oversubscribing them.
+YTDLP_FFMPEG_THREADS = 4
+_DL_SEM = asyncio.Semaphore(max(1, (os.cpu_count() or 1) // YTDLP_FFMPEG_THREADS))
+
+
+# Completed-download rows are buffered and written in COPY batches, so a burst of
+# downloads costs one round-trip instead of one INSERT each.
+DOWNLOAD_FLUSH_INTERVAL = 0.1  # seconds
+DOWNLOAD_FLUSH_BATCH = 100
+# A failed write is retried this many times, backing off from the delay below, before
+# the flusher gives up for now; the rows stay queued for the next flush.
+DOWNLOAD_FLUSH_RETRIES = 3
+DOWNLOAD_FLUSH_RETRY_DELAY = 1.0  # seconds, doubled per retry
+_PENDING_DOWNLOADS: deque[dict] = deque()
+_download_flusher: Optional[asyncio.Task] = None
+
+
+def _queue_download_record(record: dict) -> None:
+    global _download_flusher
+    _PENDING_DOWNLOADS.append(record)
+    if _download_flusher is None or _download_flusher.done():
+        _download_flusher = asyncio.create_task(_flush_download_records())
+
+
+def _pending_download(
+    youtube_url: str, quality: str, format: Optional[str], audio_only: bool
+) -> Optional[dict]:
+    """Return a queued-but-unflushed download record matching the dedup key."""
+    for record in _PENDING_DOWNLOADS:
+        if (
+            record["youtube_url"] == youtube_url
+            and record["quality"] == quality
+            and record["format"] == format
+            and record["audio_only"] == audio_only
+        ):
+            return record
+    return None
+
+
+async def _save_download_batch(db: asyncpg.Connection, batch: list[dict]) -> None:
+    try:
+        await db_copy_many(db, "downloads", batch)
+    except asyncpg.UniqueViolationError:
+        # COPY is all-or-nothing; insert one by one so only the duplicates are
+        # dropped
+        for record in batch:
+            try:
+                await db_create(db, "downloads", **record)
+            except asyncpg.UniqueViolationError:
+                pass
+    logger.info(f"Saved {len(batch)} download records")
+
+
+async def _flush_download_records() -> None:
+    """Drain queued download records in COPY batches on a dedicated connection.
+
+    A batch that fails to save goes back to the front of the queue and is retried
+    on a fresh connection. Exits once the queue is empty, or after
+    DOWNLOAD_FLUSH_RETRIES failures in a row with the rows still queued;
+    _queue_download_record or flush_download_records starts a new flusher.
+    """
+    failures = 0
+    while _PENDING_DOWNLOADS:
+        try:
+            async for db in get_db():
+                try:
+                    while _PENDING_DOWNLOADS:
+                        if len(_PENDING_DOWNLOADS) < DOWNLOAD_FLUSH_BATCH:
+                            await asyncio.sleep(DOWNLOAD_FLUSH_INTERVAL)
+                        batch = [
+                            _PENDING_DOWNLOADS.popleft()
+                            for _ in range(
+                                min(DOWNLOAD_FLUSH_BATCH, len(_PENDING_DOWNLOADS))
+                            )
+                        ]
+                        try:
+                            await _save_download_batch(db, batch)
+                        except BaseException:
+                            _PENDING_DOWNLOADS.extendleft(reversed(batch))
+                            raise
+                        failures = 0
+                finally:
+                    await db.close()
+        except Exception as e:
+            failures += 1
+            if failures > DOWNLOAD_FLUSH_RETRIES:
+                logger.error(
+                    f"Failed to save download records, {len(_PENDING_DOWNLOADS)} "
+                    f"left queued: {e}"
+                )
+                return
+            delay = DOWNLOAD_FLUSH_RETRY_DELAY * 2 ** (failures - 1)
+            logger.warning(
+                f"Failed to save download records, retrying in {delay}s: {e}"
+            )
+            await asyncio.sleep(delay)
+
+
+async def flush_download_records() -> None:
+    """Write every queued download record; await on shutdown so completed downloads
+    are not lost with the process."""
+    if _download_flusher is not None and not _download_flusher.done():
+        await _download_flusher
+    if _PENDING_DOWNLOADS:
+        await _flush_download_records()
+    if _PENDING_DOWNLOADS:
+        logger.error(f"Exiting with {len(_PENDING_DOWNLOADS)} unsaved download records")
+
+
+def _content_key(path: str) -> str:
+    """Content-addressed bucket key for a downloaded file (sha256 of its bytes).
+
+    hashlib.file_digest hashes in C via OpenSSL, which uses the CPU's SHA
+    extensions where available.
+    """
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+    ext = os.path.splitext(path)[1]
+    return f"yt/{digest[:2]}/{digest}{ext}"
 
 
-class YouTubeDownloadOptions(BaseModel):
+def _download_temp_dir(expected_size: Optional[int] = None) -> str:
+    """Pick the staging dir for yt-dlp output.
+
+    CLIPPER_TMP wins when set. Otherwise prefer /dev/shm (tmpfs) so the later upload
+    reads from page cache instead of disk, falling back to the regular temp dir when
+    tmpfs is missing or lacks headroom for the expected file.
+    """
+    override = os.getenv("CLIPPER_TMP")
+    if override:
+        return override
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        try:
+            free = shutil.disk_usage(shm).free
+        except OSError:
+            free = 0
+        if expected_size and free > expected_size * 1.5:
+            return shm
+    return tempfile.gettempdir()
+
+
+_TRUE_STRINGS = frozenset({"1", "true", "yes", "on"})
+_FALSE_STRINGS = frozenset({"", "0", "false", "no", "off"})
+
+
+def _option_str(name: str, value: object) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError(f"{name} must be a string, got {type(value).__name__}")
+
+
+def _option_bool(name: str, value: object) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in _TRUE_STRINGS:
+            return True
+        if lowered in _FALSE_STRINGS:
+            return False
+        raise ValueError(f"{name} must be a boolean, got {value!r}")
+    raise TypeError(f"{name} must be a boolean, got {type(value).__name__}")
+
+
+@dataclass(slots=True)
+class YouTubeDownloadOptions:
     """Options for downloading video from YouTube."""
 
     quality: Optional[str] = "best"  # e.g., "best", "worst", "720p", "1080p", etc.
     format: Optional[str] = None  # e.g., "mp4", "webm", etc.
     audio_only: bool = False  # if True, download only audio
 
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "YouTubeDownloadOptions":
+        """Build from a job's op data; unknown keys are ignored."""
+        data = data or {}
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+    def __post_init__(self):
+        # Normalize once here; dedup lookups, the in-flight key and the DB record
+        # all compare these values directly. Job data is JSON, so the types are
+        # coerced too: "false" must not be a truthy audio_only, and a bare height
+        # like 720 means "720p".
+        if isinstance(self.quality, int) and not isinstance(self.quality, bool):
+            self.quality = f"{self.quality}p"
+        self.quality = _option_str("quality", self.quality) or "best"
+        self.format = _option_str("format", self.format) or None
+        self.audio_only = _option_bool("audio_only", self.audio_only)
+
+
+# In-flight downloads keyed by (url, quality, format, audio_only); concurrent duplicate
+# requests await the first one instead of repeating the download + upload.
+_INFLIGHT: dict[tuple, asyncio.Future] = {}
+
+
+class _LeaderCancelled(Exception):
+    """Set on an in-flight future when the call doing the download was cancelled;
+    the followers waiting on it were not, so they retry instead."""
+
 
 async def download_youtube_to_bucket(
     youtube_url: str,
@@ -32,6 +237,7 @@ async def download_youtube_to_bucket(
     """Download video from YouTube using yt-dlp and upload to the primary bucket.
 
     Checks for existing downloads first to avoid duplicates. Stores metadata in downloads table.
+    Concurrent calls for the same URL and options share a single download.
 
     Returns (filename, presigned_url) tuple.
     """
@@ -40,23 +246,56 @@ async def download_youtube_to_bucket(
 
     # Normalize options
     if not isinstance(opts, YouTubeDownloadOptions):
-        opts = YouTubeDownloadOptions.model_validate(opts or {})
+        opts = YouTubeDownloadOptions.from_dict(opts)
 
+    key = (youtube_url, opts.quality, opts.format, opts.audio_only)
+    while (inflight := _INFLIGHT.get(key)) is not None:
+        logger.info(f"Joining in-flight download for {youtube_url}")
+        try:
+            # shield: a cancelled follower must not cancel the shared download
+            return await asyncio.shield(inflight)
+        except _LeaderCancelled:
+            # the leader was cancelled, not us: join the next one or lead
+            continue
+
+    fut = asyncio.get_running_loop().create_future()
+    _INFLIGHT[key] = fut
+    try:
+        result = await _download_youtube_to_bucket(youtube_url, opts, db)
+        fut.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        fut.set_exception(_LeaderCancelled())
+        fut.exception()  # mark retrieved; there may be no followers
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # mark retrieved; followers (if any) re-raise it themselves
+        raise
+    finally:
+        _INFLIGHT.pop(key, None)
+
+
+async def _download_youtube_to_bucket(
+    youtube_url: str,
+    opts: YouTubeDownloadOptions,
+    db: Optional[asyncpg.Connection] = None,
+) -> tuple[str, str]:
+    """Body of download_youtube_to_bucket; opts are already normalized."""
     # Check for existing download if database is available
     if db is not None:
+        pending = _pending_download(
+            youtube_url, opts.quality, opts.format, opts.audio_only
+        )
+        if pending is not None:
+            filename = pending["filename"]
+            logger.info(
+                f"Found existing download for {youtube_url}: {filename} (skipping download)"
+            )
+            return filename, get_url(filename, pending["bucketname"])
         try:
-            # Build filters for duplicate check (handle NULL format properly)
-            filters = {
-                "youtube_url": youtube_url,
-                "quality": opts.quality or "best",
-                "audio_only": opts.audio_only,
-            }
             # Use SQL query directly to handle NULL format properly
-            quality_val = opts.quality or "best"
-            format_val = opts.format
-            audio_only_val = opts.audio_only
-
-            if format_val:
+            if opts.format:
                 sql = """
                     SELECT * FROM downloads 
                     WHERE youtube_url = $1 
@@ -66,7 +305,7 @@ async def download_youtube_to_bucket(
                     ORDER BY id DESC LIMIT 1
                 """
                 existing = await db.fetch(
-                    sql, youtube_url, quality_val, format_val, audio_only_val
+                    sql, youtube_url, opts.quality, opts.format, opts.audio_only
                 )
             else:
                 sql = """
@@ -77,7 +316,9 @@ async def download_youtube_to_bucket(
                     AND audio_only = $3
                     ORDER BY id DESC LIMIT 1
                 """
-                existing = await db.fetch(sql, youtube_url, quality_val, audio_only_val)
+                existing = await db.fetch(
+                    sql, youtube_url, opts.quality, opts.audio_only
+                )
 
             if existing:
                 record = existing[0]
@@ -96,6 +337,7 @@ async def download_youtube_to_bucket(
     video_info = None
     video_id = None
     video_title = None
+    expected_size = None
 
     def _extract_info_sync() -> Optional[dict]:
         """Extract video metadata without downloading."""
@@ -115,6 +357,7 @@ async def download_youtube_to_bucket(
     if video_info:
         video_id = video_info.get("id") or video_info.get("display_id")
         video_title = video_info.get("title")
+        expected_size = video_info.get("filesize") or video_info.get("filesize_approx")
 
     # Track downloaded filename from yt-dlp progress hook
     downloaded_filename = [None]
@@ -129,6 +372,8 @@ async def download_youtube_to_bucket(
         "writesubtitles": False,
         "writeautomaticsub": False,
         "ignoreerrors": False,
+        "concurrent_fragment_downloads": 5,  # parallel HLS/DASH fragment fetches
+        "postprocessor_args": {"default": ["-threads", str(YTDLP_FFMPEG_THREADS)]},
     }
 
     # Determine output format / quality
@@ -140,13 +385,11 @@ async def download_youtube_to_bucket(
                 "preferredcodec": "mp3",
             }
         ]
-        file_ext = "mp3"
     elif opts.format:
         ydl_opts["format"] = (
             f"bestvideo[ext={opts.format}]+bestaudio[ext={opts.format}]/best[ext={opts.format}]/best"
         )
-        file_ext = opts.format
-    elif opts.quality and opts.quality != "best":
+    elif opts.quality != "best":
         # Handle quality strings like "720p", "1080p", etc.
         if opts.quality.endswith("p"):
             height = opts.quality[:-1]
@@ -155,9 +398,6 @@ async def download_youtube_to_bucket(
             )
         else:
             ydl_opts["format"] = opts.quality
-        file_ext = "mp4"
-    else:
-        file_ext = "mp4"
 
     # Capture filename from yt-dlp
     def progress_hook(d):
@@ -168,131 +408,72 @@ async def download_youtube_to_bucket(
 
     logger.info(f"Downloading from YouTube: {youtube_url} with options: {ydl_opts}")
 
-    # Create a unique temp base path for yt-dlp output
-    temp_dir = tempfile.gettempdir()
-    unique_id = f"{int(datetime.now().timestamp() * 1000)}_{uuid4().hex[:8]}"
-    temp_base = os.path.join(temp_dir, f"youtube_download_{os.getpid()}_{unique_id}")
-    temp_path_template = f"{temp_base}.%(ext)s"
-
-    # Clean up any existing files for this pattern
-    cleanup_extensions = ["mp4", "webm", "mkv", "mp3", "m4a", "part", "ytdl"]
-    for ext in cleanup_extensions:
-        candidate = f"{temp_base}.{ext}"
-        if os.path.exists(candidate):
-            try:
-                file_size = os.path.getsize(candidate)
-                os.unlink(candidate)
-                logger.info(
-                    f"Cleaned up existing temp file: {candidate} ({file_size} bytes)"
-                )
-            except Exception as e:
-                logger.warning(f"Failed to clean up {candidate}: {e}")
-
-    # Glob cleanup for any other artifacts
-    try:
-        import glob
-
-        pattern = f"{temp_base}.*"
-        for existing_file in glob.glob(pattern):
-            try:
-                if os.path.exists(existing_file):
-                    os.unlink(existing_file)
-                    logger.info(f"Cleaned up existing file: {existing_file}")
-            except Exception as e:
-                logger.warning(f"Failed to clean up {existing_file}: {e}")
-    except Exception as e:
-        logger.warning(f"Failed to glob cleanup: {e}")
-
-    # Point yt-dlp at the temp path template
-    ydl_opts["outtmpl"] = temp_path_template
-
-    def _download_sync() -> Optional[str]:
-        """Blocking part of the download, executed in a thread."""
-        import glob
-
-        pattern = f"{temp_base}.*"
-
-        # Ensure we start from a clean slate
-        for existing_file in glob.glob(pattern):
-            try:
-                if os.path.exists(existing_file):
-                    file_size = os.path.getsize(existing_file)
-                    os.unlink(existing_file)
-                    logger.info(
-                        f"Removed existing file before download: {existing_file} ({file_size} bytes)"
-                    )
-            except Exception as e:
-                logger.warning(f"Failed to remove {existing_file}: {e}")
-
-        # Double-check nothing is left
-        remaining_files = glob.glob(pattern)
-        if remaining_files:
-            logger.warning(f"Files still exist before download: {remaining_files}")
-            for f in remaining_files:
-                try:
-                    os.unlink(f)
-                except Exception:
-                    pass
-
-        logger.info(f"Starting yt-dlp download to: {temp_path_template}")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([youtube_url])
-
-            # First, try the explicit filename from the hook
-            if downloaded_filename[0] and os.path.exists(downloaded_filename[0]):
-                file_path = downloaded_filename[0]
-                if os.path.getsize(file_path) > 0:
-                    return file_path
-                logger.warning(f"Downloaded file is empty: {file_path}")
-
-            # Fall back to checking common extensions
-            for ext in ["mp4", "webm", "mkv", "mp3", "m4a", file_ext]:
-                candidate = f"{temp_base}.{ext}"
-                if os.path.exists(candidate):
-                    file_size = os.path.getsize(candidate)
-                    if file_size > 0:
+    # Stage yt-dlp output in a private temp directory. Whatever yt-dlp leaves there
+    # (merged output, per-format parts of a failed merge) is removed when the block
+    # exits, including when the download or upload raises.
+    with tempfile.TemporaryDirectory(
+        prefix=f"youtube_download_{os.getpid()}_",
+        dir=_download_temp_dir(expected_size),
+        ignore_cleanup_errors=True,
+    ) as temp_dir:
+        temp_path_template = os.path.join(temp_dir, "download.%(ext)s")
+
+        # Point yt-dlp at the temp path template
+        ydl_opts["outtmpl"] = temp_path_template
+
+        def _download_sync() -> Optional[str]:
+            """Blocking part of the download, executed in a thread."""
+            logger.info(f"Starting yt-dlp download to: {temp_path_template}")
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([youtube_url])
+
+                # First, try the explicit filename from the hook
+                if downloaded_filename[0] and os.path.exists(downloaded_filename[0]):
+                    file_path = downloaded_filename[0]
+                    if os.path.getsize(file_path) > 0:
+                        return file_path
+                    logger.warning(f"Downloaded file is empty: {file_path}")
+
+                # Fall back to any output in our private dir (one listdir instead of
+                # a stat per guessed extension)
+                for name in os.listdir(temp_dir):
+                    candidate = os.path.join(temp_dir, name)
+                    if os.path.getsize(candidate) > 0:
                         return candidate
                     logger.warning(f"Found file but it's empty: {candidate}")
 
-        return None
+            return None
 
-    downloaded_path = await asyncio.to_thread(_download_sync)
+        async with _DL_SEM:
+            downloaded_path = await asyncio.to_thread(_download_sync)
 
-    if not downloaded_path or not os.path.exists(downloaded_path):
-        raise RuntimeError(
-            f"Could not determine downloaded file path for YouTube URL: {youtube_url}"
+        if not downloaded_path or not os.path.exists(downloaded_path):
+            raise RuntimeError(
+                f"Could not determine downloaded file path for YouTube URL: {youtube_url}"
+            )
+
+        file_size = os.path.getsize(downloaded_path)
+        if file_size == 0:
+            raise RuntimeError(f"Downloaded file is empty (0 bytes): {downloaded_path}")
+
+        logger.info(
+            f"Downloaded YouTube video to temp file: {downloaded_path} ({file_size} bytes)"
         )
 
-    file_size = os.path.getsize(downloaded_path)
-    if file_size == 0:
-        raise RuntimeError(f"Downloaded file is empty (0 bytes): {downloaded_path}")
-
-    logger.info(
-        f"Downloaded YouTube video to temp file: {downloaded_path} ({file_size} bytes)"
-    )
-
-    # Read the downloaded file into memory and prepare for upload
-    def _read_and_prepare_upload():
-        with open(downloaded_path, "rb") as f:
-            file_data = f.read()
-        size = len(file_data)
-        logger.info(f"Read {size} bytes from downloaded file: {downloaded_path}")
-        if size == 0:
-            raise RuntimeError(f"Downloaded file is empty: {downloaded_path}")
-
-        filename = f"youtube_{uuid4().hex}_{os.path.basename(downloaded_path)}"
-        buffer = BytesIO(file_data)
-        buffer.name = filename
-        buffer.seek(0)
-        return buffer, filename, size
-
-    buffer, filename, file_size = await asyncio.to_thread(_read_and_prepare_upload)
-
-    # Upload to bucket
-    buffer.seek(0)
-    logger.info(f"Uploading {file_size} bytes to bucket as {filename}")
-    await upload_file(buffer, PRIMARY_BUCKET, filename)
-    logger.info(f"Uploaded YouTube video ({file_size} bytes) to bucket: {filename}")
+        # Key by content so identical downloads share one object. Stream the staged file
+        # straight to the bucket; the open and the multipart upload both happen in one
+        # worker thread, so the video never sits in our heap.
+        filename = await asyncio.to_thread(_content_key, downloaded_path)
+        if await object_exists(filename, PRIMARY_BUCKET):
+            logger.info(
+                f"Bucket already has identical content as {filename} (skipping upload)"
+            )
+        else:
+            logger.info(f"Uploading {file_size} bytes to bucket as {filename}")
+            await upload_path(downloaded_path, PRIMARY_BUCKET, filename)
+            logger.info(
+                f"Uploaded YouTube video ({file_size} bytes) to bucket: {filename}"
+            )
 
     # Get presigned URL
     presigned_url = get_url(filename, PRIMARY_BUCKET)
@@ -301,22 +482,27 @@ async def download_youtube_to_bucket(
     # Save download record to database if available
     if db is not None:
         try:
-            # First, create/retrieve the file record
-            file_records = await db_read(
-                db,
-                "files",
-                {"name": filename, "bucketname": PRIMARY_BUCKET},
-                limit=1,
-                last_id=0,
-            )
-            if file_records:
-                file_id = file_records[0]["id"]
-            else:
-                file_id = await db_create(
+            # First, create/retrieve the file record. Same lock as the bucket delete
+            # endpoint, so it can't drop the shared object while this row is added.
+            async with db.transaction():
+                await db.execute("SELECT pg_advisory_xact_lock(hashtext($1))", filename)
+                file_records = await db_read(
                     db,
                     "files",
-                    **asdict(BucketFileModel(name=filename, bucketname=PRIMARY_BUCKET)),
+                    {"name": filename, "bucketname": PRIMARY_BUCKET},
+                    limit=1,
+                    last_id=0,
                 )
+                if file_records:
+                    file_id = file_records[0]["id"]
+                else:
+                    file_id = await db_create(
+                        db,
+                        "files",
+                        **asdict(
+                            BucketFileModel(name=filename, bucketname=PRIMARY_BUCKET)
+                        ),
+                    )
 
             # Create download record
             download_record = {
@@ -326,21 +512,14 @@ async def download_youtube_to_bucket(
                 "filename": filename,
                 "bucketname": PRIMARY_BUCKET,
                 "file_id": file_id,
-                "quality": opts.quality or "best",
-                "format": opts.format or None,
+                "quality": opts.quality,
+                "format": opts.format,
                 "audio_only": opts.audio_only,
                 "created_at": datetime.now(),
             }
-            download_id = await db_create(db, "downloads", **download_record)
-            logger.info(f"Saved download record (id={download_id}) for {youtube_url}")
+            _queue_download_record(download_record)
+            logger.info(f"Queued download record for {youtube_url}")
         except Exception as e:
             logger.warning(f"Failed to save download record to database: {e}")
 
-    # Best-effort cleanup of temp file
-    try:
-        os.unlink(downloaded_path)
-        logger.info(f"Cleaned up temp file: {downloaded_path}")
-    except Exception as e:
-        logger.warning(f"Failed to clean up temp file {downloaded_path}: {e}")
-
     return filename, presigned_url
@@ -1,10 +1,39 @@
 # For easy reference and getting the processor idea check the scripts/ffmpeg.py file
-import json, subprocess, re, os, uuid
+import subprocess, re, os
 import asyncio
-from datetime import datetime
-from typing import Optional, Protocol, AsyncGenerator, Any, Union, Type
+import functools
+import inspect
+import mmap
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import accumulate
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # optional; stdlib json also parses bytes
+    from json import loads as _json_loads
+from datetime import datetime, timedelta
+from typing import (
+    Optional,
+    Protocol,
+    AsyncGenerator,
+    Any,
+    Union,
+    Type,
+    Callable,
+    Awaitable,
+    Literal,
+)
 from dataclasses import dataclass
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, ConfigDict, model_validator
 from .logger import logger
 from datetime import datetime
 from enum import Enum
@@ -15,6 +44,36 @@ ffmpeg = "ffmpeg"
 # Timeout for ffprobe (seconds); prevents hang on bad/remote input
 FFPROBE_TIMEOUT = 60
 
+# upper bound on ffprobe processes concat_videos runs at once
+CONCAT_PROBE_CONCURRENCY = 8
+
+# concat manifests for at least this many inputs are built in a worker thread
+CONCAT_THREAD_THRESHOLD = 1024
+
+# -progress key=value line carrying the output position in microseconds
+_OUT_TIME_MS_RE = re.compile(rb"out_time_ms=(\d+)")
+
+# stdin payloads are written in blocks, waiting for the pipe to drain between them
+STDIN_WRITE_SIZE = 65536
+
+# chunk size execute() starts from; stdout is buffered up to STREAM_LIMIT ahead of the
+# consumer. Outputs expected to exceed LARGE_OUTPUT_BYTES use LARGE_CHUNK_SIZE unless
+# a size is set.
+DEFAULT_CHUNK_SIZE = int(os.getenv("CLIPPER_PIPE_CHUNK", 256 * 1024))
+LARGE_CHUNK_SIZE = 1 << 20
+LARGE_OUTPUT_BYTES = 50 * 1024 * 1024
+STREAM_LIMIT = 1 << 20
+PIPE_SIZE = 1 << 20
+# without an explicit chunk size, chunks grow up to this while output backs up
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+# export_to_file flushes buffered chunks with one writev once either limit is hit
+WRITEV_MAX_CHUNKS = 64
+WRITEV_MAX_BYTES = 4 * 1024 * 1024
+
+# filter graphs longer than this are handed to ffmpeg as a script instead of argv
+FILTER_COMPLEX_INLINE_MAX = 8192
+
 
 def _safe_float(v: Any, default: float = 0.0) -> float:
     if v is None:
@@ -60,7 +119,7 @@ def _parse_ss_seconds(timestr: str) -> float:
         return 0.0
 
 
-@dataclass
+@dataclass(slots=True)
 class ExecutionResult:
     processing_time: float
     start_time: str
@@ -68,7 +127,7 @@ class ExecutionResult:
     error: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class VideoInfo:
     duration: Optional[float] = None
     size: Optional[int] = None
@@ -81,9 +140,183 @@ class VideoInfo:
     error: Optional[str] = None
 
 
+# Successful ffprobe results for local files, keyed by (path, mtime_ns, size).
+# get_video_info may run in worker threads, so access goes through the lock.
+VIDEO_INFO_CACHE_SIZE = 512
+_VIDEO_INFO_CACHE: "OrderedDict[tuple[str, int, int], VideoInfo]" = OrderedDict()
+_VIDEO_INFO_CACHE_LOCK = threading.Lock()
+
+
+def _video_info_cache_key(input_path: str) -> Optional[tuple[str, int, int]]:
+    """Cache key for a local file; None for URLs and paths only visible inside the container."""
+    try:
+        st = os.stat(input_path)
+    except (OSError, ValueError):
+        return None
+    return (input_path, st.st_mtime_ns, st.st_size)
+
+
+def _cached_video_info(key: Optional[tuple[str, int, int]]) -> Optional[VideoInfo]:
+    if key is None:
+        return None
+    with _VIDEO_INFO_CACHE_LOCK:
+        info = _VIDEO_INFO_CACHE.get(key)
+        if info is not None:
+            _VIDEO_INFO_CACHE.move_to_end(key)
+        return info
+
+
+def _cache_video_info(key: Optional[tuple[str, int, int]], info: VideoInfo) -> None:
+    if key is None or info.error is not None:
+        return
+    with _VIDEO_INFO_CACHE_LOCK:
+        _VIDEO_INFO_CACHE[key] = info
+        if len(_VIDEO_INFO_CACHE) > VIDEO_INFO_CACHE_SIZE:
+            _VIDEO_INFO_CACHE.popitem(last=False)
+
+
+def _pipe_chunk_size(expected_bytes: int) -> int:
+    return (
+        LARGE_CHUNK_SIZE if expected_bytes > LARGE_OUTPUT_BYTES else DEFAULT_CHUNK_SIZE
+    )
+
+
+def _local_size(path: str) -> int:
+    """Size of a local file, 0 for URLs and paths only visible inside the container."""
+    try:
+        return os.stat(path).st_size
+    except (OSError, ValueError):
+        return 0
+
+
+def _sink_writer(sink: Any) -> Callable[[bytes], Awaitable[None]]:
+    """Resolve once how to hand chunks to sink: an asyncio.StreamWriter (write +
+    drain), an object with a write method (sync or async), or a callable."""
+    if isinstance(sink, asyncio.StreamWriter):
+
+        async def write(chunk: bytes) -> None:
+            sink.write(chunk)
+            await sink.drain()
+
+        return write
+    fn = getattr(sink, "write", None)
+    if fn is None:
+        if not callable(sink):
+            raise TypeError(f"Unsupported sink: {type(sink).__name__}")
+        fn = sink
+    if inspect.iscoroutinefunction(fn):
+        return fn
+
+    async def write(chunk: bytes) -> None:
+        result = fn(chunk)
+        if inspect.isawaitable(result):
+            await result
+
+    return write
+
+
+def _writev_all(fd: int, bufs: list) -> None:
+    """Scatter-write bufs to fd, resuming after short writes."""
+    if not hasattr(os, "writev"):  # Windows
+        for buf in bufs:
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(fd, view) :]
+        return
+    while bufs:
+        written = os.writev(fd, bufs)
+        while bufs and written >= len(bufs[0]):
+            written -= len(bufs[0])
+            bufs.pop(0)
+        if written:
+            bufs[0] = memoryview(bufs[0])[written:]
+
+
+async def _drain_to_file(chunks: AsyncGenerator[bytes, None], path: str) -> int:
+    """Write a chunk stream to path in batched writev calls off the event loop;
+    chunks are never copied into a contiguous buffer. One batch is written while
+    the next is collected, so ffmpeg output keeps draining during disk writes."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    in_flight: Optional[asyncio.Future] = None
+    try:
+        total = 0
+        pending: list[bytes] = []
+        pending_bytes = 0
+
+        async def submit(batch: list[bytes]):
+            nonlocal in_flight
+            # at most one batch in flight keeps writes in order
+            if in_flight is not None:
+                await in_flight
+            in_flight = asyncio.ensure_future(asyncio.to_thread(_writev_all, fd, batch))
+
+        async for chunk in chunks:
+            pending.append(chunk)
+            pending_bytes += len(chunk)
+            if len(pending) >= WRITEV_MAX_CHUNKS or pending_bytes >= WRITEV_MAX_BYTES:
+                await submit(pending)
+                total += pending_bytes
+                pending = []
+                pending_bytes = 0
+        if pending:
+            await submit(pending)
+            total += pending_bytes
+        if in_flight is not None:
+            await in_flight
+        return total
+    finally:
+        if in_flight is not None and not in_flight.done():
+            # the thread still holds fd; let it finish before closing
+            await asyncio.wait([in_flight])
+        os.close(fd)
+
+
+async def _drain_to_sink(chunks: AsyncGenerator[bytes, None], sink: Any) -> int:
+    write = _sink_writer(sink)
+    total = 0
+    async for chunk in chunks:
+        await write(chunk)
+        total += len(chunk)
+    return total
+
+
+async def _drain_to_bytes(chunks: AsyncGenerator[bytes, None]) -> bytes:
+    """Collect a chunk stream and join it once at the end: the result is allocated
+    at its final size and each byte is copied exactly once, with no regrowth when
+    the output turns out larger than expected."""
+    parts = [chunk async for chunk in chunks]
+    return b"".join(parts)
+
+
+async def _drain_to_view(chunks: AsyncGenerator[bytes, None]) -> memoryview:
+    """_drain_to_bytes for callers that want a view to slice without copying."""
+    return memoryview(await _drain_to_bytes(chunks))
+
+
+async def _drain_to_mmap(chunks: AsyncGenerator[bytes, None]) -> memoryview:
+    """Write a chunk stream to an unlinked temp file and return a read-only view of
+    its mapping. Pages are loaded as the caller touches them and can be dropped by
+    the kernel under pressure, so the output never has to fit in RAM at once."""
+    fd, path = tempfile.mkstemp(prefix="clipper_")
+    os.close(fd)
+    try:
+        await _drain_to_file(chunks, path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"")  # empty files cannot be mapped
+            # the mapping keeps the data reachable after the file is closed
+            # and unlinked
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    finally:
+        os.unlink(path)
+
+
 class TextSegment(BaseModel):
     """Text overlay for a time range. end_sec=-1 means till the end of the video."""
 
+    # frozen so segments are hashable and _drawtext_opts can be memoized
+    model_config = ConfigDict(frozen=True)
+
     start_sec: float
     end_sec: float  # -1 = till end
     text: str
@@ -104,6 +337,16 @@ class WordTiming(BaseModel):
     end_sec: float
 
 
+@dataclass(slots=True)
+class _WordSpan:
+    """WordTiming fields without validation, for timings computed internally
+    (_auto_word_timings); positional construction is several times cheaper."""
+
+    word: str
+    start_sec: float
+    end_sec: float
+
+
 class KaraokeText(BaseModel):
     sentence: str
     start_sec: Optional[float] = None
@@ -153,17 +396,21 @@ class TextSequence(BaseModel):
 class SpeedSegment(BaseModel):
     """Speed override for a time range. end_sec=-1 means till the end of the video."""
 
+    model_config = ConfigDict(frozen=True)
+
     start_sec: float = 0
     end_sec: float = -1
     speed: float = 1.0
 
 
+@functools.lru_cache(maxsize=128)
 def _atempo_chain(speed: float) -> str:
     """atempo only accepts 0.5–2.0 per filter; chain as needed."""
     if speed <= 0:
         raise ValueError("speed must be positive")
     parts = []
-    s = speed
+    # 2 and 2.0 share a cache entry, so format from a float whichever came first
+    s = float(speed)
     while s > 2.0:
         parts.append("atempo=2.0")
         s /= 2.0
@@ -258,6 +505,12 @@ class TranscodeOptions(BaseModel):
         None  # target file size in MB -> computes -b:v, -maxrate, -bufsize
     )
     scale: Optional[str] = None  # e.g. "1280:-1" -> -vf scale=...
+    # -threads for the encoder and -filter_complex_threads for the graph;
+    # None leaves ffmpeg's defaults, 0 lets ffmpeg use every core
+    threads: Optional[int] = None
+    # "nvenc": encode on an NVIDIA GPU (libx264/libx265 -> h264_nvenc/hevc_nvenc)
+    # when ffmpeg has the encoder; otherwise the software codec is used
+    hw_accel: Literal["none", "nvenc"] = "none"
 
 
 class GifOptions(BaseModel):
@@ -270,7 +523,7 @@ class GifOptions(BaseModel):
     output_codec: str = "gif"
 
 
-@dataclass
+@dataclass(slots=True)
 class OperationSpec:
     """Declarative spec for a builder operation. Every op uses a single 'data' key."""
 
@@ -279,46 +532,491 @@ class OperationSpec:
     many: bool = False
 
 
-async def get_progress(
-    total_duration: int, line: str, progress_callback: ProgressCallaback
-):
-    match = re.search(r"out_time_ms=(\d+)", line)
-    if match:
-        current_ms = int(match.group(1))
-        current_sec = current_ms / 1_000_000
-        progress = (
-            min(100, (current_sec / total_duration) * 100) if total_duration > 0 else 0
+def _progress_percent(total_duration: float, data: bytes) -> Optional[float]:
+    """Latest out_time_ms in a block of stderr lines as a percentage, or None."""
+    start = data.rfind(b"out_time_ms=")
+    if start < 0:
+        return None
+    start += 12
+    end = data.find(b"\n", start)
+    try:
+        current_ms = int(data[start:] if end < 0 else data[start:end])
+    except ValueError:
+        # e.g. out_time_ms=N/A before the first frame; use the last numeric one
+        matches = _OUT_TIME_MS_RE.findall(data)
+        if not matches:
+            return None
+        current_ms = int(matches[-1])
+    current_sec = current_ms / 1_000_000
+    return min(100, (current_sec / total_duration) * 100) if total_duration > 0 else 0
+
+
+def install_uvloop() -> bool:
+    """Use uvloop for event loops created after this call (subprocess pipes and
+    stream reads in execute() run through libuv). Call before asyncio.run();
+    uvicorn already picks uvloop itself when it is installed. Returns False if
+    uvloop is not available.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def _widen_stdout_pipe(transport: asyncio.SubprocessTransport) -> None:
+    """Best-effort: grow the kernel pipe behind process stdout (Linux only)."""
+    if fcntl is None or not hasattr(fcntl, "F_SETPIPE_SZ"):
+        return
+    try:
+        pipe = transport.get_pipe_transport(1).get_extra_info("pipe")
+        fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+    except (AttributeError, OSError):
+        pass
+
+
+# CLIPPER_* settings are read once, on first use rather than at import, so a .env
+# loaded after this module is imported still applies. reset_env() re-reads them.
+@functools.cache
+def _in_container() -> bool:
+    """ffmpeg runs directly in production; on the host it goes through docker compose exec."""
+    return os.getenv("CLIPPER_ENV", "").lower() == "production"
+
+
+@functools.cache
+def _clipper_service() -> Optional[str]:
+    return os.getenv("CLIPPER_CONTAINER_NAME")
+
+
+@functools.cache
+def _local_ffprobe() -> bool:
+    return os.getenv("CLIPPER_LOCAL_FFPROBE", "").lower() in ("1", "true")
+
+
+def reset_env() -> None:
+    """Forget the cached CLIPPER_* settings (after changing the environment)."""
+    _in_container.cache_clear()
+    _clipper_service.cache_clear()
+    _local_ffprobe.cache_clear()
+
+
+# compose service name -> container id, filled on first use by _resolve_container_id
+_CONTAINER_IDS: dict[str, str] = {}
+# compose service name -> monotonic time of its last failed lookup
+_CONTAINER_LOOKUP_FAILED: dict[str, float] = {}
+# how long a failed lookup is trusted before docker compose ps runs again
+_LOOKUP_RETRY_SEC = 30.0
+# docker compose ps answers from the daemon; no need to wait as long as ffprobe
+_CONTAINER_LOOKUP_TIMEOUT = 10
+# what docker exec prints when the container it was given is gone
+_CONTAINER_GONE_MARKERS = ("No such container", "is not running")
+
+
+def _container_lookup_cmd(service: str) -> Optional[list[str]]:
+    """The docker compose ps command to look service up with, or None when there
+    is nothing to run: the id is cached, or the last failure is still recent."""
+    if service in _CONTAINER_IDS:
+        return None
+    failed_at = _CONTAINER_LOOKUP_FAILED.get(service)
+    if failed_at is not None and time.monotonic() - failed_at < _LOOKUP_RETRY_SEC:
+        return None
+    return ["docker", "compose", "ps", "-q", service]
+
+
+def _record_container_lookup(service: str, stdout: Optional[bytes]) -> Optional[str]:
+    """Remember the outcome of a lookup (stdout None when it failed to run). A
+    failure is remembered for _LOOKUP_RETRY_SEC, not the missing id."""
+    ids = stdout.split() if stdout else None
+    if not ids:
+        _CONTAINER_LOOKUP_FAILED[service] = time.monotonic()
+        return None
+    _CONTAINER_LOOKUP_FAILED.pop(service, None)
+    cid = _CONTAINER_IDS[service] = ids[0].decode()
+    return cid
+
+
+def _resolve_container_id(service: str) -> Optional[str]:
+    """Container id of a running compose service, looked up once per process.
+    None when docker compose cannot tell, e.g. the service is not up yet.
+    Blocks: coroutines use _resolve_container_id_async."""
+    cmd = _container_lookup_cmd(service)
+    if cmd is None:
+        return _CONTAINER_IDS.get(service)
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=_CONTAINER_LOOKUP_TIMEOUT,
         )
-        await progress_callback(progress)
+    except (OSError, subprocess.SubprocessError):
+        return _record_container_lookup(service, None)
+    return _record_container_lookup(service, result.stdout)
 
 
-def get_cmd(input: list[str]):
-    env_mode = os.getenv("CLIPPER_ENV", "").lower()
-    is_in_container = env_mode == "production"
+async def _resolve_container_id_async(service: str) -> Optional[str]:
+    """_resolve_container_id without blocking the event loop."""
+    cmd = _container_lookup_cmd(service)
+    if cmd is None:
+        return _CONTAINER_IDS.get(service)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        return _record_container_lookup(service, None)
+    try:
+        stdout, _ = await asyncio.wait_for(
+            process.communicate(), _CONTAINER_LOOKUP_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return _record_container_lookup(service, None)
+    except asyncio.CancelledError:  # don't leave docker running
+        process.kill()
+        await process.wait()
+        raise
+    return _record_container_lookup(
+        service, stdout if process.returncode == 0 else None
+    )
 
-    if is_in_container:
-        return input
 
-    # On host: use docker compose exec to run inside clipper service
-    clipper_service = os.getenv("CLIPPER_CONTAINER_NAME")
+def _forget_container_id(cmd: list[str], stderr: str) -> None:
+    """Drop the container id a failed docker exec ran on when docker reports the
+    container gone, so the next get_cmd looks the service up again (or falls back
+    to docker compose exec). Other failures are ffmpeg's and keep the id."""
+    if len(cmd) < 4 or cmd[0] != "docker" or cmd[1] != "exec":
+        return
+    if not any(marker in stderr for marker in _CONTAINER_GONE_MARKERS):
+        return
+    for service, cid in list(_CONTAINER_IDS.items()):
+        if cid == cmd[3]:
+            del _CONTAINER_IDS[service]
+
+
+def _host_cmd(service: str, cid: Optional[str], input: list[str]) -> list[str]:
+    # docker exec on the resolved container skips re-reading the compose file on
+    # every call; docker compose exec is the fallback while the id is unknown
+    if cid is not None:
+        return ["docker", "exec", "-i", cid, *input]
     return [
         "docker",
         "compose",
         "exec",
         "-i",
         "-T",
-        clipper_service,
+        service,
         *input,
     ]
 
 
-def _build_concat_manifest(paths: list[str]) -> str:
-    """Build FFmpeg concat demuxer manifest. Escapes single quotes in paths."""
-    lines = []
-    for p in paths:
-        escaped = (p or "").replace("'", "'\\''")
-        lines.append(f"file '{escaped}'")
-    return "\n".join(lines) + "\n"
+def get_cmd(input: list[str]):
+    if _in_container():
+        return input
+    # On host: run inside the clipper service
+    clipper_service = _clipper_service()
+    return _host_cmd(clipper_service, _resolve_container_id(clipper_service), input)
+
+
+async def get_cmd_async(input: list[str]) -> list[str]:
+    """get_cmd for coroutines: the container lookup doesn't block the event loop."""
+    if _in_container():
+        return input
+    clipper_service = _clipper_service()
+    return _host_cmd(
+        clipper_service, await _resolve_container_id_async(clipper_service), input
+    )
+
+
+def get_probe_cmd(input: list[str]):
+    """Like get_cmd, but CLIPPER_LOCAL_FFPROBE=1 runs ffprobe on the host and skips
+    the docker exec round-trip. Only set it when the host sees media at
+    the same paths as the container.
+    """
+    if _local_ffprobe():
+        return input
+    return get_cmd(input)
+
+
+async def get_probe_cmd_async(input: list[str]) -> list[str]:
+    """get_probe_cmd for coroutines."""
+    if _local_ffprobe():
+        return input
+    return await get_cmd_async(input)
+
+
+# software codec -> NVENC encoder, and x264-style preset -> NVENC p1 (fastest)..p7
+_NVENC_CODECS = {"libx264": "h264_nvenc", "libx265": "hevc_nvenc"}
+_NVENC_PRESETS = {
+    "ultrafast": "p1",
+    "superfast": "p1",
+    "veryfast": "p2",
+    "faster": "p3",
+    "fast": "p3",
+    "medium": "p4",
+    "slow": "p5",
+    "slower": "p6",
+    "veryslow": "p7",
+    "placebo": "p7",
+}
+
+# encoders the ffmpeg build supports, listed once per process by _ffmpeg_encoders
+_FFMPEG_ENCODERS: Optional[frozenset[str]] = None
+# monotonic time of the last failed ffmpeg -encoders run
+_ENCODERS_LOOKUP_FAILED: Optional[float] = None
+
+
+def _ffmpeg_encoders() -> frozenset[str]:
+    """Names from ffmpeg -encoders. Empty when ffmpeg cannot be run, so hardware
+    encoding falls back to software; the failure is remembered for
+    _LOOKUP_RETRY_SEC before ffmpeg is asked again. Blocks: call it off the event
+    loop (export does, from _probe_inputs)."""
+    global _FFMPEG_ENCODERS, _ENCODERS_LOOKUP_FAILED
+    if _FFMPEG_ENCODERS is not None:
+        return _FFMPEG_ENCODERS
+    failed_at = _ENCODERS_LOOKUP_FAILED
+    if failed_at is not None and time.monotonic() - failed_at < _LOOKUP_RETRY_SEC:
+        return frozenset()
+    try:
+        result = subprocess.run(
+            get_cmd([ffmpeg, "-hide_banner", "-encoders"]),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=FFPROBE_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError):
+        _ENCODERS_LOOKUP_FAILED = time.monotonic()
+        return frozenset()
+    # " V....D h264_nvenc   NVIDIA NVENC H.264 encoder"; the table follows " ------"
+    _, _, table = result.stdout.decode(errors="replace").partition("------")
+    _FFMPEG_ENCODERS = frozenset(
+        fields[1] for fields in map(str.split, table.splitlines()) if len(fields) > 1
+    )
+    _ENCODERS_LOOKUP_FAILED = None
+    return _FFMPEG_ENCODERS
+
+
+def _nvenc_codec(opts: TranscodeOptions) -> Optional[str]:
+    """NVENC encoder to use for opts, or None for the software path. Only reads
+    the encoder list _ffmpeg_encoders cached; _build never runs ffmpeg for it."""
+    if opts.hw_accel != "nvenc":
+        return None
+    codec = _NVENC_CODECS.get(opts.codec)
+    if codec is None or codec not in (_FFMPEG_ENCODERS or ()):
+        return None
+    return codec
+
+
+def _build_concat_manifest(paths: list[str]) -> bytes:
+    """Build FFmpeg concat demuxer manifest as UTF-8 bytes. Escapes single quotes in paths."""
+    return _concat_manifest(tuple(paths))
+
+
+@functools.lru_cache(maxsize=256)
+def _concat_manifest(paths: tuple[str, ...]) -> bytes:
+    return b"".join(
+        b"file '" + (p or "").encode("utf-8").replace(b"'", b"'\\''") + b"'\n"
+        for p in paths
+    )
+
+
+def _manifest_memfd(manifest: bytes, name: str = "concat") -> Optional[int]:
+    """Put the manifest in a memfd ffmpeg can open as /dev/fd/N.
+
+    Only when ffmpeg is spawned directly (in the container) on Linux; through
+    docker compose exec the fd would not reach ffmpeg. Returns None otherwise.
+    """
+    if not _in_container() or not hasattr(os, "memfd_create"):
+        return None
+    fd = os.memfd_create(name, os.MFD_CLOEXEC | getattr(os, "MFD_ALLOW_SEALING", 0))
+    try:
+        _writev_all(fd, [manifest])
+        os.lseek(fd, 0, os.SEEK_SET)
+    except OSError:
+        os.close(fd)
+        return None
+    _seal_memfd(fd)
+    return fd
+
+
+def _seal_memfd(fd: int) -> None:
+    """Best-effort: freeze the memfd's size and contents once written, so ffmpeg
+    reads exactly what was built (Linux only)."""
+    if fcntl is None or not hasattr(fcntl, "F_ADD_SEALS"):
+        return
+    try:
+        fcntl.fcntl(
+            fd,
+            fcntl.F_ADD_SEALS,
+            fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_GROW | fcntl.F_SEAL_WRITE,
+        )
+    except OSError:
+        pass
+
+
+def _filter_complex_script(cmd: list[str]) -> tuple[list[str], Optional[int]]:
+    """Move a long -filter_complex graph out of argv into a memfd script.
+
+    Returns the (possibly rewritten) command and the fd to pass to ffmpeg, or
+    None when the graph stays inline.
+    """
+    try:
+        i = cmd.index("-filter_complex")
+    except ValueError:
+        return cmd, None
+    graph = cmd[i + 1]
+    if len(graph) <= FILTER_COMPLEX_INLINE_MAX:
+        return cmd, None
+    fd = _manifest_memfd(graph.encode("utf-8"), "filter_complex")
+    if fd is None:
+        return cmd, None
+    return [*cmd[:i], "-filter_complex_script", f"/dev/fd/{fd}", *cmd[i + 2 :]], fd
+
+
+class _FFmpegProtocol(asyncio.SubprocessProtocol):
+    """Subprocess protocol for execute(): pipe data is handled as it arrives from
+    the transport instead of going through StreamReader.
+
+    stdout chunks are queued for the generator (reading pauses once buffered
+    reaches high_water); stderr is split into lines for the error tail and
+    scanned for progress inline.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        high_water: int,
+        total_duration: Optional[Union[float, Callable[[], Optional[float]]]] = None,
+    ):
+        self._loop = loop
+        self.high_water = high_water
+        self._total_duration = total_duration
+        self.transport: Optional[asyncio.SubprocessTransport] = None
+        self._stdout: deque[bytes] = deque()
+        self._buffered = 0
+        self._stdout_eof = False
+        self._reading_paused = False
+        self._read_waiter: Optional[asyncio.Future] = None
+        self._stderr_partial = b""
+        # tail of raw lines; only decoded if the process fails
+        self.std_error: deque[bytes] = deque(maxlen=100)
+        self.progress: Optional[float] = None
+        self.progress_changed = asyncio.Event()
+        self._writing_paused = False
+        self._stdin_closed = False
+        self._drain_waiter: Optional[asyncio.Future] = None
+        self.finished = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def pipe_data_received(self, fd, data):
+        if fd == 1:
+            self._stdout.append(data)
+            self._buffered += len(data)
+            self._wake_reader()
+            if self._buffered >= self.high_water and not self._reading_paused:
+                self.transport.get_pipe_transport(1).pause_reading()
+                self._reading_paused = True
+        elif fd == 2:
+            # complete lines from this read are handled as one block
+            lines, sep, self._stderr_partial = (self._stderr_partial + data).rpartition(
+                b"\n"
+            )
+            if sep:
+                self._stderr_lines(lines)
+
+    def _stderr_lines(self, data: bytes):
+        self.std_error.extend(data.split(b"\n"))
+        total = self._total_duration
+        if callable(total):
+            total = total()
+        if total is not None:
+            progress = _progress_percent(total, data)
+            if progress is not None:
+                self.progress = progress
+                self.progress_changed.set()
+
+    def pipe_connection_lost(self, fd, exc):
+        if fd == 0:
+            self._stdin_closed = True
+            self._wake_writer()
+        elif fd == 1:
+            self._stdout_eof = True
+            self._wake_reader()
+        elif fd == 2 and self._stderr_partial:
+            self._stderr_lines(self._stderr_partial)
+            self._stderr_partial = b""
+
+    def connection_lost(self, exc):
+        # process exited and every pipe is closed
+        self.progress_changed.set()
+        if not self.finished.done():
+            self.finished.set_result(None)
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        self._wake_writer()
+
+    def _wake_reader(self):
+        if self._read_waiter is not None and not self._read_waiter.done():
+            self._read_waiter.set_result(None)
+
+    def _wake_writer(self):
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    async def read(self, max_size: int) -> bytes:
+        """Next stdout data, or b"" once stdout is closed and drained. Chunks already
+        buffered are joined up to max_size; a single larger chunk is returned whole.
+        """
+        while not self._stdout and not self._stdout_eof:
+            self._read_waiter = self._loop.create_future()
+            await self._read_waiter
+        if not self._stdout:
+            return b""
+        chunk = self._stdout.popleft()
+        size = len(chunk)
+        if self._stdout and size + len(self._stdout[0]) <= max_size:
+            parts = [chunk]
+            while self._stdout and size + len(self._stdout[0]) <= max_size:
+                parts.append(self._stdout.popleft())
+                size += len(parts[-1])
+            chunk = b"".join(parts)
+        self._buffered -= size
+        if self._reading_paused and self._buffered < self.high_water:
+            self.transport.get_pipe_transport(1).resume_reading()
+            self._reading_paused = False
+        return chunk
+
+    def discard_stdout(self):
+        """Drop buffered and future stdout so an abandoned process can run to exit."""
+        self.high_water = float("inf")
+        self._stdout.clear()
+        self._buffered = 0
+        if self._reading_paused:
+            self.transport.get_pipe_transport(1).resume_reading()
+            self._reading_paused = False
+
+    async def write_stdin(self, data: bytes):
+        """Write in blocks, waiting for the pipe to drain between them."""
+        pipe = self.transport.get_pipe_transport(0)
+        view = memoryview(data)
+        for offset in range(0, len(view), STDIN_WRITE_SIZE):
+            if self._stdin_closed:
+                return
+            pipe.write(view[offset : offset + STDIN_WRITE_SIZE])
+            while self._writing_paused and not self._stdin_closed:
+                self._drain_waiter = self._loop.create_future()
+                await self._drain_waiter
+        pipe.close()
 
 
 # make sure to pass -f in the command to determine the output type as we are not passing output externally
@@ -326,80 +1024,143 @@ def _build_concat_manifest(paths: list[str]) -> str:
 async def execute(
     cmd: list[str],
     input: str,
-    chunk_size: int = 8192,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
     complete_callback: Optional[OnCompleteCallback] = None,
     progress_callback: Optional[ProgressCallaback] = None,
-    stdin: Optional[Union[str, bytes]] = None,
-    total_duration: Optional[float] = None,
+    stdin: Optional[bytes] = None,
+    total_duration: Optional[Union[float, Callable[[], Optional[float]]]] = None,
+    pass_fds: tuple[int, ...] = (),
+    max_chunk_size: Optional[int] = None,
 ):
+    """Run ffmpeg and yield its stdout. Up to STREAM_LIMIT bytes of stdout are
+    buffered ahead of the consumer; chunks are yielded as the pipe delivers them
+    and are split so none is longer than chunk_size. Chunks are bytes, or
+    memoryview windows when a delivered block had to be split.
+    total_duration may be a callable when the duration is still being worked out
+    while ffmpeg runs; it is read on every progress update and progress is not
+    reported while it returns None.
+    With max_chunk_size, the chunk size adapts between chunk_size and
+    max_chunk_size: it doubles while reads come back full (output is arriving
+    faster than it is consumed) and halves once they come back under half full.
+    """
+    # one wall-clock sample; elapsed time comes from the monotonic clock
     start_time = datetime.now()
-    if total_duration is None:
-        video_info: VideoInfo = await asyncio.to_thread(
-            lambda: VideoBuilder.get_video_info(input)
-        )
+    started = time.monotonic_ns()
+    # the duration is only used to turn out_time_ms into a percentage
+    if total_duration is None and progress_callback is not None:
+        video_info = await VideoBuilder.get_video_info_async(input)
         total_duration = video_info.duration
 
+    track_progress = progress_callback is not None and (
+        callable(total_duration) or (total_duration is not None and total_duration > 0)
+    )
+    # Nobody consumes stderr without callbacks, so don't pipe and drain it; except
+    # through docker exec, where it tells a removed container from an ffmpeg error
+    capture_stderr = (
+        progress_callback is not None
+        or complete_callback is not None
+        or cmd[:2] == ["docker", "exec"]
+    )
+
+    # -progress carries the structured progress and is only requested when it
+    # will be reported; otherwise its blocks would just crowd the error tail.
+    # The per-frame stats line is noise and the log only needs errors/warnings.
     cmd = [
         *cmd,
-        "-progress",
-        "pipe:2",
+        "-nostats",
+        "-loglevel",
+        "warning" if progress_callback is not None else "error",
+        *(("-progress", "pipe:2") if track_progress else ()),
         "pipe:1",
     ]
 
     logger.info(cmd)
-    process = await asyncio.subprocess.create_subprocess_exec(
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.subprocess_exec(
+        lambda: _FFmpegProtocol(
+            loop,
+            max(STREAM_LIMIT, 2 * chunk_size),
+            total_duration if track_progress else None,
+        ),
         *cmd,
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        stdin=asyncio.subprocess.PIPE if stdin is not None else None,
+        stderr=subprocess.PIPE if capture_stderr else subprocess.DEVNULL,
+        stdin=subprocess.PIPE if stdin is not None else None,
+        pass_fds=pass_fds,
     )
+    _widen_stdout_pipe(transport)
 
-    # Write stdin in background if provided (subprocess expects bytes)
-    async def write_stdin():
-        if stdin is not None:
-            data = stdin.encode("utf-8") if isinstance(stdin, str) else stdin
-            process.stdin.write(data)
-            await process.stdin.drain()
-            process.stdin.close()
-            await process.stdin.wait_closed()
-
-    stdin_task = asyncio.create_task(write_stdin())
+    pending = []
+    if stdin is not None:
+        pending.append(asyncio.create_task(protocol.write_stdin(stdin)))
 
-    std_error: list[str] = []
-
-    async def read_stderr():
+    async def report_progress():
+        # coalesces: only the latest value is reported after each wake-up
+        reported = None
         while True:
-            line = await process.stderr.readline()
-            if not line:
-                break
-            line = line.decode(errors="replace").rstrip()
-            std_error.append(line)
-            if progress_callback and total_duration is not None and total_duration > 0:
-                await get_progress(total_duration, line, progress_callback)
+            await protocol.progress_changed.wait()
+            protocol.progress_changed.clear()
+            if protocol.progress is not None and protocol.progress != reported:
+                reported = protocol.progress
+                await progress_callback(reported)
+            if protocol.finished.done():
+                return
 
-    std_error_task = asyncio.create_task(read_stderr())
+    if track_progress:
+        pending.append(asyncio.create_task(report_progress()))
 
     try:
+        read_size = chunk_size
         while True:
-            chunk = await process.stdout.read(chunk_size)
+            chunk = await protocol.read(read_size)
             if not chunk:
                 break
-            yield chunk
+            size = read_size
+            if max_chunk_size is not None:
+                if len(chunk) >= read_size and read_size < max_chunk_size:
+                    read_size = min(read_size * 2, max_chunk_size)
+                    protocol.high_water = max(STREAM_LIMIT, 2 * read_size)
+                elif len(chunk) < read_size // 2 and read_size > chunk_size:
+                    read_size = max(read_size // 2, chunk_size)
+                    protocol.high_water = max(STREAM_LIMIT, 2 * read_size)
+            if len(chunk) <= size:
+                yield chunk
+                continue
+            # split without copying: windows over the chunk the pipe delivered
+            view = memoryview(chunk)
+            for offset in range(0, len(view), size):
+                yield view[offset : offset + size]
     finally:
-        await asyncio.gather(process.wait(), stdin_task, std_error_task)
+        protocol.discard_stdout()
+        try:
+            await protocol.finished
+            # a failing progress callback or stdin write must not skip the close and
+            # the return-code check below; it is raised after them
+            task_errors = [
+                r
+                for r in await asyncio.gather(*pending, return_exceptions=True)
+                if isinstance(r, BaseException)
+            ]
+        finally:
+            returncode = transport.get_returncode()
+            transport.close()
 
-        end_time = datetime.now()
+        processing_time = (time.monotonic_ns() - started) / 1e9
+        end_time = start_time + timedelta(seconds=processing_time)
 
         error: Optional[str] = None
-        if process.returncode != 0:
-            error = "\n".join(std_error[-100:])
-            raise RuntimeError(
-                f"ffmpeg/ffprobe exited with code {process.returncode}: {error}"
+        if returncode != 0:
+            error = "\n".join(
+                line.decode(errors="replace").rstrip() for line in protocol.std_error
             )
+            _forget_container_id(cmd, error)
+            raise RuntimeError(f"ffmpeg/ffprobe exited with code {returncode}: {error}")
+        if task_errors:
+            raise task_errors[0]
         result = ExecutionResult(
             start_time=start_time,
             end_time=end_time,
-            processing_time=(end_time - start_time).total_seconds(),
+            processing_time=processing_time,
             error=error,
         )
 
@@ -412,6 +1173,7 @@ def _drawtext_enable(start_sec: float, end_sec: float) -> str:
     return f"between(t,{start_sec},{end_sec})"
 
 
+@functools.lru_cache(maxsize=256)
 def _drawtext_opts(
     seg: TextSegment,
     duration: float,
@@ -450,30 +1212,136 @@ def _drawtext_opts(
     return ":".join(opts)
 
 
+def _relabel_output(parts: list[str], label: str, out: str) -> bool:
+    """Rename the output pad of the filter producing label to out. False if no filter produces it."""
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i].endswith(label):
+            parts[i] = parts[i][: -len(label)] + out
+            return True
+    return False
+
+
 def _resolve_end_sec(end_sec: float, duration: float) -> float:
     return duration if end_sec < 0 else end_sec
 
 
-def _get_media_duration(path: str) -> float:
-    """Get duration in seconds from any media file (video or audio). Returns 0 on error."""
-    cmd = get_cmd(
-        [ffprobe, "-v", "quiet", "-print_format", "json", "-show_format", path]
-    )
+# Durations of local media files by (path, mtime_ns, size), shared by the sync and
+# async probes; guarded like _VIDEO_INFO_CACHE.
+_MEDIA_DURATION_CACHE: "OrderedDict[tuple[str, int, int], float]" = OrderedDict()
+_MEDIA_DURATION_CACHE_LOCK = threading.Lock()
+
+
+def _cached_media_duration(key: Optional[tuple[str, int, int]]) -> Optional[float]:
+    if key is None:
+        return None
+    with _MEDIA_DURATION_CACHE_LOCK:
+        duration = _MEDIA_DURATION_CACHE.get(key)
+        if duration is not None:
+            _MEDIA_DURATION_CACHE.move_to_end(key)
+        return duration
+
+
+def _cache_media_duration(key: Optional[tuple[str, int, int]], duration: float) -> None:
+    if key is None:
+        return
+    with _MEDIA_DURATION_CACHE_LOCK:
+        _MEDIA_DURATION_CACHE[key] = duration
+        if len(_MEDIA_DURATION_CACHE) > VIDEO_INFO_CACHE_SIZE:
+            _MEDIA_DURATION_CACHE.popitem(last=False)
+
+
+def _media_duration_args(path: str) -> list[str]:
+    return [ffprobe, "-v", "quiet", "-print_format", "json", "-show_format", path]
+
+
+def _parse_media_duration(stdout: bytes) -> float:
+    fmt = _json_loads(stdout).get("format") or {}
+    return _safe_float(fmt.get("duration"), 0.0)
+
+
+def _probe_media_duration(path: str) -> float:
+    cmd = get_probe_cmd(_media_duration_args(path))
     try:
+        # ffprobe is quiet; stderr only carries docker's errors
         result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True, timeout=FFPROBE_TIMEOUT
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+            timeout=FFPROBE_TIMEOUT,
         )
-        data = json.loads(result.stdout)
-        fmt = data.get("format") or {}
-        return _safe_float(fmt.get("duration"), 0.0)
-    except Exception:
-        return 0.0
+    except subprocess.CalledProcessError as e:
+        _forget_container_id(cmd, e.stderr.decode(errors="replace"))
+        raise
+    return _parse_media_duration(result.stdout)
+
+
+async def _probe_media_duration_async(path: str) -> float:
+    cmd = await get_probe_cmd_async(_media_duration_args(path))
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), FFPROBE_TIMEOUT)
+    except BaseException:  # timeout or cancellation: don't leave ffprobe running
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        _forget_container_id(cmd, stderr.decode(errors="replace"))
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    return _parse_media_duration(stdout)
+
+
+def _get_media_duration(path: str) -> float:
+    """Get duration in seconds from any media file (video or audio). Returns 0 on error.
+    Local files are probed once until they change."""
+    key = _video_info_cache_key(path)
+    duration = _cached_media_duration(key)
+    if duration is None:
+        try:
+            duration = _probe_media_duration(path)
+        except Exception:
+            return 0.0
+        _cache_media_duration(key, duration)
+    return duration
+
+
+async def _get_media_duration_async(path: str) -> float:
+    """_get_media_duration for async callers: ffprobe runs as an asyncio subprocess,
+    so several probes can be awaited together."""
+    key = _video_info_cache_key(path)
+    duration = _cached_media_duration(key)
+    if duration is None:
+        try:
+            duration = await _probe_media_duration_async(path)
+        except Exception:
+            return 0.0
+        _cache_media_duration(key, duration)
+    return duration
 
 
 def _ass_escape(text: str) -> str:
+    # chained replace beats str.translate here: tokens are single words, and each
+    # replace is a C-level scan that returns text unchanged when nothing matches
+    # (translate is ~10x slower below a couple of KB)
     return text.replace("\\", r"\\").replace("{", r"\{").replace("}", r"\}")
 
 
+_ASS_NAMED_COLORS = {
+    "black": "000000",
+    "white": "FFFFFF",
+    "red": "FF0000",
+    "green": "00FF00",
+    "blue": "0000FF",
+    "yellow": "FFFF00",
+    "cyan": "00FFFF",
+    "magenta": "FF00FF",
+}
+_HEX6_RE = re.compile(r"[0-9a-f]{6}")
+
+
+@functools.lru_cache(maxsize=256)
 def _ass_color(color: Optional[str], default_rgb: str = "FFFFFF") -> str:
     if not color:
         rgb = default_rgb
@@ -487,21 +1355,11 @@ def _ass_color(color: Optional[str], default_rgb: str = "FFFFFF") -> str:
                 alpha = float(parts[1])
             except ValueError:
                 alpha = 1.0
-        named = {
-            "black": "000000",
-            "white": "FFFFFF",
-            "red": "FF0000",
-            "green": "00FF00",
-            "blue": "0000FF",
-            "yellow": "FFFF00",
-            "cyan": "00FFFF",
-            "magenta": "FF00FF",
-        }
-        if rgb_part.lower() in named:
-            rgb = named[rgb_part.lower()]
-        else:
-            hex_part = rgb_part.lower().replace("#", "").replace("0x", "")
-            rgb = hex_part if len(hex_part) == 6 else default_rgb
+        name = rgb_part.lower()
+        rgb = _ASS_NAMED_COLORS.get(name)
+        if rgb is None:
+            hex_part = name.lstrip("#").removeprefix("0x")
+            rgb = hex_part if _HEX6_RE.fullmatch(hex_part) else default_rgb
 
     alpha = max(0.0, min(1.0, alpha))
     ass_alpha = int(round((1.0 - alpha) * 255))
@@ -510,15 +1368,20 @@ def _ass_color(color: Optional[str], default_rgb: str = "FFFFFF") -> str:
 
 
 def _ass_time(sec: float) -> str:
-    if sec < 0:
-        sec = 0
-    h = int(sec // 3600)
-    m = int((sec % 3600) // 60)
-    s = sec % 60
-    cs = int(round((s - int(s)) * 100))
-    return f"{h}:{m:02d}:{int(s):02d}.{cs:02d}"
+    # one rounding to whole centiseconds, then integer divmods; rounding the
+    # fraction on its own could print ".100" for e.g. 1.999
+    cs = round(sec * 100) if sec > 0 else 0
+    m, cs = divmod(cs, 6000)
+    h, m = divmod(m, 60)
+    s, cs = divmod(cs, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+
+# drawtext-style "h-<offset>" y position -> bottom margin
+_Y_OFFSET_RE = re.compile(r"h-(\d+(?:\.\d+)?)")
 
 
+@functools.lru_cache(maxsize=256)
 def _ass_alignment_and_margins(x: str, y: str) -> tuple[int, int, int, int]:
     align = 2
     margin_l = 20
@@ -537,7 +1400,7 @@ def _ass_alignment_and_margins(x: str, y: str) -> tuple[int, int, int, int]:
     elif x_norm == "(w-text_w)/2":
         align = 2 if align in (1, 2, 3) else 8
 
-    m = re.match(r"^h-(\d+(?:\.\d+)?)$", y_norm)
+    m = _Y_OFFSET_RE.fullmatch(y_norm)
     if m:
         align = 2 if align in (1, 2, 3) else 8
         margin_v = int(float(m.group(1)))
@@ -567,36 +1430,47 @@ def _ass_style(
     )
 
 
+# characters that don't count towards a word's karaoke weight
+_NON_WORD_RE = re.compile(r"\W")
+
+
 def _split_sentence_words(sentence: str) -> list[str]:
-    return [w for w in re.split(r"\s+", sentence.strip()) if w]
+    # str.split() already splits on runs of whitespace and drops empties
+    return sentence.split()
 
 
 def _word_weight(word: str) -> int:
-    cleaned = re.sub(r"[^\w]", "", word)
-    return max(1, len(cleaned))
+    return max(1, len(_NON_WORD_RE.sub("", word)))
 
 
 def _auto_word_timings(
     sentence: str, start_sec: float, end_sec: float
-) -> list[WordTiming]:
+) -> list[_WordSpan]:
     words = _split_sentence_words(sentence)
     if not words:
         return []
     duration = end_sec - start_sec
     if duration <= 0:
         return []
-    weights = [_word_weight(w) for w in words]
-    total = sum(weights) or len(words)
-    timings: list[WordTiming] = []
-    current = start_sec
-    for i, word in enumerate(words):
-        if i == len(words) - 1:
-            end = end_sec
-        else:
-            end = current + duration * (weights[i] / total)
-        timings.append(WordTiming(word=word, start_sec=current, end_sec=end))
-        current = end
-    return timings
+    # word boundaries straight from the cumulative weights, so rounding doesn't
+    # build up along the sentence; the last word always ends at end_sec
+    cumulative = list(accumulate(map(_word_weight, words)))
+    scale = duration / cumulative[-1]
+    bounds = [start_sec, *(start_sec + c * scale for c in cumulative[:-1]), end_sec]
+    return [_WordSpan(word, bounds[i], bounds[i + 1]) for i, word in enumerate(words)]
+
+
+def _invalidates_cmd(method):
+    """Mark a VideoBuilder setter: drops the memoized ffmpeg command and filter pieces."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._cmd_epoch += 1
+        self._cmd_cache.clear()
+        self._render_cache.clear()
+        return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class VideoBuilder:
@@ -662,78 +1536,151 @@ class VideoBuilder:
         self._audio_bitrate = audio_bitrate
         self.complete_callback = complete_callback
         self.progress_callback = progress_callback
-        self._chunk_size = 8192
+        # None: picked from the expected output size at export time
+        self._chunk_size: Optional[int] = None
         self._trim_start: Optional[float] = None
         self._trim_end: Optional[float] = None
         self._trim_duration: Optional[float] = None
         self._watermark: Optional[WatermarkOverlay] = None
         self._text_segments: list[TextSegment] = []
-        self._karaoke_segments: list[tuple[KaraokeText, list[WordTiming]]] = []
+        self._karaoke_segments: list[
+            tuple[KaraokeText, list[Union[WordTiming, _WordSpan]]]
+        ] = []
         self._text_sequences: list[TextSequence] = []
         self._speed_segments: list[SpeedSegment] = []
         self._ass_files_to_cleanup: list[str] = []
+        self._ass_fds: list[int] = []
         self._background_audio: Optional[AudioOverlay] = None
+        # media durations probed ahead of _build (see _probe_inputs)
+        self._media_durations: dict[str, float] = {}
         self._background_color: Optional[BackgroundColor] = None
         self._transcode: Optional[TranscodeOptions] = None
         self._gif_options: Optional[GifOptions] = None
+        # bumped by every builder setter; part of the _cmd_cache key
+        self._cmd_epoch = 0
+        self._cmd_cache: dict[tuple, list[str]] = {}
+        # (kind, ...) -> rendered ASS scripts or drawtext chain, reused across
+        # exports even when the command is not (ASS memfds/files are made fresh)
+        self._render_cache: dict[tuple, Any] = {}
 
     @staticmethod
     def get_video_info(input_path: str) -> VideoInfo:
-        cmd = get_cmd(
-            [
-                ffprobe,
-                "-v",
-                "quiet",
-                "-print_format",
-                "json",
-                "-show_format",
-                "-show_streams",
-                input_path,
-            ]
+        """Probe input_path. Results for local files are cached until the file changes."""
+        key = _video_info_cache_key(input_path)
+        info = _cached_video_info(key)
+        if info is None:
+            info = VideoBuilder._probe_video_info(input_path)
+            _cache_video_info(key, info)
+        return info
+
+    @staticmethod
+    async def get_video_info_async(input_path: str) -> VideoInfo:
+        """get_video_info for async callers: ffprobe runs as an asyncio subprocess
+        instead of occupying a thread in the default executor."""
+        key = _video_info_cache_key(input_path)
+        info = _cached_video_info(key)
+        if info is None:
+            info = await VideoBuilder._probe_video_info_async(input_path)
+            _cache_video_info(key, info)
+        return info
+
+    @staticmethod
+    def _probe_args(input_path: str) -> list[str]:
+        return [
+            ffprobe,
+            "-v",
+            "quiet",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+            input_path,
+        ]
+
+    @staticmethod
+    def _parse_probe_output(output: dict) -> VideoInfo:
+        streams = output.get("streams", [])
+        video_stream = next(
+            (s for s in streams if s.get("codec_type") == "video"), None
         )
+        if not video_stream:
+            return VideoInfo(error="Not a video stream")
+        fmt = output.get("format") or {}
+        duration = _safe_float(fmt.get("duration"), 0.0)
+        if duration <= 0:
+            return VideoInfo(error="Invalid or zero duration")
+        has_audio = any(s.get("codec_type") == "audio" for s in streams)
+        return VideoInfo(
+            duration=duration,
+            size=_safe_int(fmt.get("size"), 0),
+            bitrate=_safe_int(fmt.get("bit_rate"), 0),
+            width=video_stream.get("width"),
+            height=video_stream.get("height"),
+            codec=video_stream.get("codec_name"),
+            fps=_parse_fps(video_stream.get("r_frame_rate", "0/1")),
+            has_audio=has_audio,
+        )
+
+    @staticmethod
+    def _probe_video_info(input_path: str) -> VideoInfo:
+        cmd = get_probe_cmd(VideoBuilder._probe_args(input_path))
         try:
+            # ffprobe is quiet; stderr only carries docker's errors
             result = subprocess.run(
                 cmd,
-                capture_output=True,
-                text=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 check=True,
                 timeout=FFPROBE_TIMEOUT,
             )
-            output = json.loads(result.stdout)
-            streams = output.get("streams", [])
-            video_stream = next(
-                (s for s in streams if s.get("codec_type") == "video"), None
-            )
-            if not video_stream:
-                return VideoInfo(error="Not a video stream")
-            fmt = output.get("format") or {}
-            duration = _safe_float(fmt.get("duration"), 0.0)
-            if duration <= 0:
-                return VideoInfo(error="Invalid or zero duration")
-            has_audio = any(s.get("codec_type") == "audio" for s in streams)
-            return VideoInfo(
-                duration=duration,
-                size=_safe_int(fmt.get("size"), 0),
-                bitrate=_safe_int(fmt.get("bit_rate"), 0),
-                width=video_stream.get("width"),
-                height=video_stream.get("height"),
-                codec=video_stream.get("codec_name"),
-                fps=_parse_fps(video_stream.get("r_frame_rate", "0/1")),
-                has_audio=has_audio,
-            )
+            return VideoBuilder._parse_probe_output(_json_loads(result.stdout))
+        except subprocess.CalledProcessError as e:
+            _forget_container_id(cmd, e.stderr.decode(errors="replace"))
+            return VideoInfo(error=str(e))
         except subprocess.TimeoutExpired as e:
             return VideoInfo(error=f"ffprobe timeout: {e}")
         except Exception as e:
             return VideoInfo(error=str(e))
 
+    @staticmethod
+    async def _probe_video_info_async(input_path: str) -> VideoInfo:
+        cmd = await get_probe_cmd_async(VideoBuilder._probe_args(input_path))
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(), FFPROBE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                e = subprocess.TimeoutExpired(cmd, FFPROBE_TIMEOUT)
+                return VideoInfo(error=f"ffprobe timeout: {e}")
+            except asyncio.CancelledError:
+                # e.g. a sibling concat probe failed; don't leave ffprobe running
+                process.kill()
+                await process.wait()
+                raise
+            if process.returncode != 0:
+                _forget_container_id(cmd, stderr.decode(errors="replace"))
+                return VideoInfo(
+                    error=str(subprocess.CalledProcessError(process.returncode, cmd))
+                )
+            return VideoBuilder._parse_probe_output(_json_loads(stdout))
+        except Exception as e:
+            return VideoInfo(error=str(e))
+
     @property
     def chunk_size(self) -> int:
-        return self._chunk_size
+        return self._chunk_size or DEFAULT_CHUNK_SIZE
 
     @chunk_size.setter
     def chunk_size(self, value: int) -> None:
         self._chunk_size = value
 
+    @_invalidates_cmd
     def trim(
         self,
         start_sec: float = 0,
@@ -747,6 +1694,7 @@ class VideoBuilder:
         self._trim_duration = duration
         return self
 
+    @_invalidates_cmd
     def add_watermark(
         self,
         overlay: Optional[WatermarkOverlay] = None,
@@ -764,6 +1712,7 @@ class VideoBuilder:
             )
         return self
 
+    @_invalidates_cmd
     def add_text(
         self,
         segment: Union[TextSegment, list[TextSegment]],
@@ -775,6 +1724,7 @@ class VideoBuilder:
             self._text_segments.append(segment)
         return self
 
+    @_invalidates_cmd
     def add_karaoke_text(self, data: KaraokeText) -> "VideoBuilder":
         """Generate word-highlight subtitles for a sentence using ASS."""
         sentence = (data.sentence or "").strip()
@@ -798,12 +1748,14 @@ class VideoBuilder:
 
         return self
 
+    @_invalidates_cmd
     def add_text_sequence(self, data: TextSequence) -> "VideoBuilder":
         """Add a sequence of timed text items with fade animation using ASS."""
         if data.items:
             self._text_sequences.append(data)
         return self
 
+    @_invalidates_cmd
     def speed_control(
         self,
         segment: Union[SpeedSegment, list[SpeedSegment], float],
@@ -819,6 +1771,7 @@ class VideoBuilder:
             self._speed_segments.append(segment)
         return self
 
+    @_invalidates_cmd
     def add_background_audio(
         self,
         overlay: Optional[AudioOverlay] = None,
@@ -836,6 +1789,7 @@ class VideoBuilder:
             )
         return self
 
+    @_invalidates_cmd
     def set_background_color(
         self,
         overlay: Optional[BackgroundColor] = None,
@@ -850,6 +1804,7 @@ class VideoBuilder:
             self._background_color = BackgroundColor(color=color, only_color=only_color)
         return self
 
+    @_invalidates_cmd
     def transcode(
         self,
         options: Optional[TranscodeOptions] = None,
@@ -875,6 +1830,7 @@ class VideoBuilder:
             )
         return self
 
+    @_invalidates_cmd
     def compress(
         self,
         target_size_mb: Optional[float] = None,
@@ -888,37 +1844,39 @@ class VideoBuilder:
         **kwargs: Any,
     ) -> "VideoBuilder":
         """Compress video with optional target size (MB) and scale. Optional transcode overrides (codec, crf, audio_codec, audio_bitrate, movflags)."""
-        opts: dict[str, Any] = {
-            "codec": codec or "libx264",
-            "preset": preset,
-            "crf": 23 if crf is None else crf,
-            "audio_codec": audio_codec or "aac",
-            "audio_bitrate": audio_bitrate or "128k",
-            "target_size_mb": target_size_mb,
-            "scale": scale,
-            "movflags": movflags,
-        }
-        opts.update(kwargs)
+        # target_size_mb/scale/movflags default to None on the model, so they can be
+        # passed as-is; only the extra kwargs need None dropped
         self._transcode = TranscodeOptions(
-            **{k: v for k, v in opts.items() if v is not None}
+            codec=codec or "libx264",
+            preset=preset or "medium",
+            crf=23 if crf is None else crf,
+            audio_codec=audio_codec or "aac",
+            audio_bitrate=audio_bitrate or "128k",
+            target_size_mb=target_size_mb,
+            scale=scale,
+            movflags=movflags,
+            **{k: v for k, v in kwargs.items() if v is not None},
         )
         return self
 
+    @_invalidates_cmd
     def create_gif(self, options: GifOptions) -> "VideoBuilder":
         """Set GIF export options. When set, export_to_bytes() produces an animated GIF."""
         self._gif_options = options
         return self
 
+    @functools.cached_property
     def _karaoke_media_paths(self) -> tuple[str, str]:
+        """(host dir, dir as ffmpeg sees it) for ASS files; resolved once per builder."""
         media_host = os.path.abspath("media")
-        if os.getenv("CLIPPER_ENV", "").lower() == "production":
+        if _in_container():
             return media_host, media_host
         return media_host, "/code/media"
 
     def _render_karaoke_ass(
         self,
         data: KaraokeText,
-        timings: list[WordTiming],
+        timings: list[Union[WordTiming, _WordSpan]],
         width: int,
         height: int,
     ) -> str:
@@ -958,42 +1916,37 @@ class VideoBuilder:
             "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
         ]
 
+        box_tag = f"\\4c{back_highlight}" if data.boxcolor else ""
+        bord_tag = f"\\bord{bord}" if bord > 0 else ""
+        hl_prefix = f"{{\\1c{highlight_color}{box_tag}{bord_tag}}}"
+        # escape each token once; every event only swaps in its highlighted word
+        escaped = [_ass_escape(tok) for tok in tokens]
         events: list[str] = []
         for i, w in enumerate(timings):
-            parts: list[str] = []
-            for j, tok in enumerate(tokens):
-                if j == i:
-                    box_tag = f"\\4c{back_highlight}" if data.boxcolor else ""
-                    bord_tag = f"\\bord{bord}" if bord > 0 else ""
-                    parts.append(
-                        f"{{\\1c{highlight_color}{box_tag}{bord_tag}}}{_ass_escape(tok)}{{\\r}}"
-                    )
-                else:
-                    parts.append(_ass_escape(tok))
+            parts = escaped.copy()
+            parts[i] = f"{hl_prefix}{escaped[i]}{{\\r}}"
             text = " ".join(parts)
             events.append(
                 f"Dialogue: 0,{_ass_time(w.start_sec)},{_ass_time(w.end_sec)},Default,,0,0,0,,{text}"
             )
 
-        return "\n".join(header + events) + "\n"
+        # one list and one join; the trailing "" gives the final newline without
+        # copying the whole script again
+        header.extend(events)
+        header.append("")
+        return "\n".join(header)
 
     def _build_karaoke_ass_files(self, width: int, height: int) -> list[str]:
         if not self._karaoke_segments:
             return []
-        media_host, media_ffmpeg = self._karaoke_media_paths()
-        karaoke_dir = os.path.join(media_host, "karaoke")
-        os.makedirs(karaoke_dir, exist_ok=True)
-        out_paths: list[str] = []
-        for data, timings in self._karaoke_segments:
-            filename = f"karaoke_{uuid.uuid4().hex}.ass"
-            host_path = os.path.join(karaoke_dir, filename)
-            ffmpeg_path = f"{media_ffmpeg}/karaoke/{filename}"
-            content = self._render_karaoke_ass(data, timings, width, height)
-            with open(host_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            self._ass_files_to_cleanup.append(host_path)
-            out_paths.append(ffmpeg_path)
-        return out_paths
+        key = ("karaoke", width, height)
+        scripts = self._render_cache.get(key)
+        if scripts is None:
+            scripts = self._render_cache[key] = [
+                self._render_karaoke_ass(data, timings, width, height)
+                for data, timings in self._karaoke_segments
+            ]
+        return [self._write_ass(script, "karaoke", "karaoke") for script in scripts]
 
     def _render_text_sequence_ass(
         self, sequence: TextSequence, width: int, height: int
@@ -1043,40 +1996,61 @@ class VideoBuilder:
                 f"Dialogue: 0,{_ass_time(item.start_sec)},{_ass_time(item.end_sec)},{style_name},,0,0,0,,{text}"
             )
 
-        return (
-            "\n".join(
-                header
-                + styles
-                + [
-                    "",
-                    "[Events]",
-                    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
-                ]
-                + events
+        header.extend(styles)
+        header.extend(
+            (
+                "",
+                "[Events]",
+                "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
             )
-            + "\n"
         )
+        header.extend(events)
+        header.append("")
+        return "\n".join(header)
 
     def _build_text_sequence_ass_files(self, width: int, height: int) -> list[str]:
         if not self._text_sequences:
             return []
-        media_host, media_ffmpeg = self._karaoke_media_paths()
-        seq_dir = os.path.join(media_host, "text_sequences")
-        os.makedirs(seq_dir, exist_ok=True)
-        out_paths: list[str] = []
-        for seq in self._text_sequences:
-            filename = f"textseq_{uuid.uuid4().hex}.ass"
-            host_path = os.path.join(seq_dir, filename)
-            ffmpeg_path = f"{media_ffmpeg}/text_sequences/{filename}"
-            content = self._render_text_sequence_ass(seq, width, height)
-            with open(host_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            self._ass_files_to_cleanup.append(host_path)
-            out_paths.append(ffmpeg_path)
-        return out_paths
+        key = ("text_sequences", width, height)
+        scripts = self._render_cache.get(key)
+        if scripts is None:
+            scripts = self._render_cache[key] = [
+                self._render_text_sequence_ass(seq, width, height)
+                for seq in self._text_sequences
+            ]
+        return [
+            self._write_ass(script, "text_sequences", "textseq") for script in scripts
+        ]
+
+    def _write_ass(self, content: str, subdir: str, prefix: str) -> str:
+        """Hand an ASS script to ffmpeg and return the path it should open: a memfd
+        when ffmpeg runs in this container (nothing touches the disk), else a file
+        under media/<subdir>. Both are released by _cleanup_ass_files."""
+        data = content.encode("utf-8")
+        fd = _manifest_memfd(data, prefix)
+        if fd is not None:
+            self._ass_fds.append(fd)
+            return f"/dev/fd/{fd}"
+        media_host, media_ffmpeg = self._karaoke_media_paths
+        host_dir = os.path.join(media_host, subdir)
+        os.makedirs(host_dir, exist_ok=True)
+        filename = f"{prefix}_{secrets.token_hex(12)}.ass"
+        host_path = os.path.join(host_dir, filename)
+        # already encoded for the memfd attempt; write the bytes straight to the fd
+        fd = os.open(host_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            _writev_all(fd, [data])
+        finally:
+            os.close(fd)
+        self._ass_files_to_cleanup.append(host_path)
+        return f"{media_ffmpeg}/{subdir}/{filename}"
 
     def _cleanup_ass_files(self) -> None:
-        """Remove temporary .ass files created for karaoke/text_sequences after export."""
+        """Remove temporary .ass files (and close memfds) created for
+        karaoke/text_sequences after export."""
+        for fd in self._ass_fds:
+            os.close(fd)
+        self._ass_fds.clear()
         for path in self._ass_files_to_cleanup:
             try:
                 os.unlink(path)
@@ -1110,12 +2084,12 @@ class VideoBuilder:
         )
         # When background audio is longer than video, extend output to match.
         # Do NOT extend when trim was explicitly given (user set end_sec or duration).
-        trim_explicit = (
-            self._trim_end is not None and self._trim_end >= 0
-        ) or self._trim_duration is not None
+        trim_explicit = self._trim_explicit()
         output_duration = effective_duration
         if self._background_audio is not None and not trim_explicit:
-            audio_dur = _get_media_duration(self._background_audio.path)
+            audio_dur = self._media_durations.get(self._background_audio.path)
+            if audio_dur is None:
+                audio_dur = _get_media_duration(self._background_audio.path)
             if audio_dur > 0 and audio_dur > effective_duration:
                 output_duration = audio_dur
 
@@ -1147,53 +2121,56 @@ class VideoBuilder:
                 and not self._background_color.only_color
             ):
                 parts.append(
-                    f"color=c={self._background_color.color}:s={w}x{h}:d={output_duration}:r=30[bg];"
+                    f"color=c={self._background_color.color}:s={w}x{h}:d={output_duration}:r=30[bg]"
                 )
 
             if self._trim_start is not None:
-                trim_v = f"[0:v]trim=start={self._trim_start}:end={trim_end},setpts=PTS-STARTPTS[v_trim]"
+                parts.append(
+                    f"[0:v]trim=start={self._trim_start}:end={trim_end},setpts=PTS-STARTPTS[v_trim]"
+                )
                 if not use_mute_source_only:
-                    trim_v += f";[0:a]atrim=start={self._trim_start}:end={trim_end},asetpts=PTS-STARTPTS[a_trim]"
-                parts.append(trim_v)
+                    parts.append(
+                        f"[0:a]atrim=start={self._trim_start}:end={trim_end},asetpts=PTS-STARTPTS[a_trim]"
+                    )
                 audio_in = "[a_trim]" if not use_mute_source_only else "[0:a]"
                 video_in = "[v_trim]"
 
-        speed_segments = []
+        # (start, end, speed) in the trimmed timeline; plain tuples, since these are
+        # derived from already validated segments
+        speed_segments: list[tuple[float, float, float]] = []
+        ts = self._trim_start
         for s in self._speed_segments:
-            end = _resolve_end_sec(s.end_sec, duration)
             start = s.start_sec
-            if self._trim_start is not None:
-                start = max(0, s.start_sec - self._trim_start)
-                end = min(trim_end - self._trim_start, end - self._trim_start)
-            speed_segments.append(
-                SpeedSegment(start_sec=start, end_sec=end, speed=s.speed)
-            )
+            end = _resolve_end_sec(s.end_sec, duration)
+            if ts is not None:
+                start = max(0, start - ts)
+                end = min(trim_end - ts, end - ts)
+            speed_segments.append((float(start), float(end), s.speed))
 
         if speed_segments:
-            if len(speed_segments) == 1 and speed_segments[0].speed != 1.0:
-                seg = speed_segments[0]
-                atempo = _atempo_chain(seg.speed)
-                parts.append(
-                    f"{video_in}setpts=PTS/{seg.speed}[v_spd];"
-                    f"{audio_in}{atempo},asetpts=PTS-STARTPTS[a_spd]"
-                )
+            if len(speed_segments) == 1 and speed_segments[0][2] != 1.0:
+                speed = speed_segments[0][2]
+                atempo = _atempo_chain(speed)
+                parts.append(f"{video_in}setpts=PTS/{speed}[v_spd]")
+                parts.append(f"{audio_in}{atempo},asetpts=PTS-STARTPTS[a_spd]")
                 video_in = "[v_spd]"
                 audio_in = "[a_spd]"
             elif len(speed_segments) > 1:
                 n = len(speed_segments)
-                v_filters = []
-                a_filters = []
-                for i, seg in enumerate(speed_segments):
-                    end = seg.end_sec  # already in trimmed timeline if trim set
-                    v_filters.append(
-                        f"{video_in}trim=start={seg.start_sec}:end={end},setpts=PTS/{seg.speed},setpts=PTS-STARTPTS[v_s{i}]"
+                for i, (start, end, speed) in enumerate(speed_segments):
+                    # rebase and retime in one setpts: (PTS-STARTPTS)/speed is what
+                    # setpts=PTS/speed,setpts=PTS-STARTPTS computed in two passes
+                    parts.append(
+                        f"{video_in}trim=start={start}:end={end},setpts=(PTS-STARTPTS)/{speed}[v_s{i}]"
                     )
-                    a_filters.append(
-                        f"{audio_in}atrim=start={seg.start_sec}:end={end},{_atempo_chain(seg.speed)},asetpts=PTS-STARTPTS[a_s{i}]"
+                for i, (start, end, speed) in enumerate(speed_segments):
+                    parts.append(
+                        f"{audio_in}atrim=start={start}:end={end},{_atempo_chain(speed)},asetpts=PTS-STARTPTS[a_s{i}]"
                     )
-                parts.append(";".join(v_filters) + ";" + ";".join(a_filters))
                 parts.append(
-                    f"{''.join(f'[v_s{i}]' for i in range(n))}concat=n={n}:v=1:a=0[v_spd];"
+                    f"{''.join(f'[v_s{i}]' for i in range(n))}concat=n={n}:v=1:a=0[v_spd]"
+                )
+                parts.append(
                     f"{''.join(f'[a_s{i}]' for i in range(n))}concat=n={n}:v=0:a=1[a_spd]"
                 )
                 video_in = "[v_spd]"
@@ -1202,36 +2179,33 @@ class VideoBuilder:
         if self._text_segments:
             # Chain multiple drawtext filters with comma; colons only separate options within one filter
             # Pass trim_start and effective_duration so segment times are in output timeline
-            drawtext_filters = [
-                f"drawtext={_drawtext_opts(seg, duration, self._trim_start, effective_duration)}"
-                for seg in self._text_segments
-            ]
-            text_chain = ",".join(drawtext_filters)
+            key = ("drawtext", duration, self._trim_start, effective_duration)
+            text_chain = self._render_cache.get(key)
+            if text_chain is None:
+                text_chain = self._render_cache[key] = ",".join(
+                    f"drawtext={_drawtext_opts(seg, duration, self._trim_start, effective_duration)}"
+                    for seg in self._text_segments
+                )
             parts.append(f"{video_in}{text_chain}[v_txt]")
             video_in = "[v_txt]"
 
-        if self._karaoke_segments:
-            ass_files = self._build_karaoke_ass_files(w, h)
-            for i, path in enumerate(ass_files):
-                esc_path = (path or "").replace("'", r"\'")
-                parts.append(f"{video_in}subtitles='{esc_path}'[v_kar{i}]")
-                video_in = f"[v_kar{i}]"
-
-        if self._text_sequences:
-            seq_files = self._build_text_sequence_ass_files(w, h)
-            for i, path in enumerate(seq_files):
-                esc_path = (path or "").replace("'", r"\'")
-                parts.append(f"{video_in}subtitles='{esc_path}'[v_seq{i}]")
-                video_in = f"[v_seq{i}]"
+        # karaoke then text sequences as one comma-separated filter chain, instead
+        # of a separately labelled link per script
+        ass_paths = [
+            *self._build_karaoke_ass_files(w, h),
+            *self._build_text_sequence_ass_files(w, h),
+        ]
+        if ass_paths:
+            escaped = [(path or "").replace("'", r"\'") for path in ass_paths]
+            sub_chain = ",".join(f"subtitles='{path}'" for path in escaped)
+            parts.append(f"{video_in}{sub_chain}[v_subs]")
+            video_in = "[v_subs]"
 
         if self._watermark is not None:
             extra_inputs.append(self._watermark.path)
             w = self._watermark
-            overlay_filter = (
-                f"[1]format=rgba,colorchannelmixer=aa={w.opacity}[wm];"
-                f"{video_in}[wm]overlay={w.position.value}[v_wm]"
-            )
-            parts.append(overlay_filter)
+            parts.append(f"[1]format=rgba,colorchannelmixer=aa={w.opacity}[wm]")
+            parts.append(f"{video_in}[wm]overlay={w.position.value}[v_wm]")
             video_in = "[v_wm]"
 
         if self._background_audio is not None:
@@ -1285,8 +2259,12 @@ class VideoBuilder:
             parts.append(f"{video_in}scale={scale}[v_scaled]")
             video_in = "[v_scaled]"
 
-        # Pass-through to named outputs (FFmpeg requires a filter between input and output)
-        parts.append(f"{video_in}setpts=PTS[v_out];{audio_in}anull[a_out]")
+        # Name the last stage's output [v_out]/[a_out]; a pass-through filter is only
+        # needed when a stream is still the raw input (FFmpeg requires a filter between)
+        if not _relabel_output(parts, video_in, "[v_out]"):
+            parts.append(f"{video_in}setpts=PTS[v_out]")
+        if not _relabel_output(parts, audio_in, "[a_out]"):
+            parts.append(f"{audio_in}anull[a_out]")
         filter_complex = ";".join(parts)
         return extra_inputs, filter_complex
 
@@ -1360,7 +2338,7 @@ class VideoBuilder:
                 a_filters.append(
                     f"{audio_in}atrim=start={seg_start}:end={seg_end},{_atempo_chain(seg.speed)},asetpts=PTS-STARTPTS[a_s{i}]"
                 )
-            parts.append(";".join(a_filters))
+            parts.extend(a_filters)
             parts.append(
                 f"{''.join(f'[a_s{i}]' for i in range(n))}concat=n={n}:v=0:a=1[a_out]"
             )
@@ -1383,6 +2361,25 @@ class VideoBuilder:
             out_format,
         ]
 
+    def _cached_build(self, info: VideoInfo, action: str = "export") -> list[str]:
+        """_build, memoized per builder until the next setter call."""
+        if self._karaoke_segments or self._text_sequences:
+            # these write ASS files that are removed after every export
+            return self._build(info, action)
+        key = (
+            action,
+            self._cmd_epoch,
+            info.duration,
+            info.width,
+            info.height,
+            info.has_audio,
+            tuple(self._media_durations.items()),
+        )
+        cmd = self._cmd_cache.get(key)
+        if cmd is None:
+            cmd = self._cmd_cache[key] = self._build(info, action)
+        return list(cmd)
+
     def _build(self, info: VideoInfo, action: str = "export") -> list[str]:
         """Build the ffmpeg argument list. action='export' or 'extract_audio'. execute() calls this internally."""
         if action == "extract_audio":
@@ -1418,28 +2415,37 @@ class VideoBuilder:
         )
         duration_sec = info.duration or 1.0
         movflags = opts.movflags or "+frag_keyframe+empty_moov"
-        cmd_parts = [
-            ffmpeg,
-            "-i",
-            self.input_path,
-            *[x for i in extra_inputs for x in ("-i", i)],
-            "-filter_complex",
-            filter_complex,
-            "-map",
-            "[v_out]",
-            "-map",
-            "[a_out]",
-            "-c:v",
-            opts.codec,
-            "-preset",
-            opts.preset,
-            "-c:a",
-            opts.audio_codec,
-            "-f",
-            self._video_format.value,
-            "-movflags",
-            movflags,
-        ]
+        nvenc = _nvenc_codec(opts)
+        cmd_parts = [ffmpeg]
+        if opts.threads is not None:
+            cmd_parts.extend(("-filter_complex_threads", str(opts.threads)))
+        if nvenc:
+            # GPU decode only: frames come back to system memory because the
+            # filter graph (drawtext, ass, overlay) runs on the CPU
+            cmd_parts.extend(("-hwaccel", "cuda"))
+        cmd_parts.extend(("-i", self.input_path))
+        for extra in extra_inputs:
+            cmd_parts.extend(("-i", extra))
+        cmd_parts.extend(
+            (
+                "-filter_complex",
+                filter_complex,
+                "-map",
+                "[v_out]",
+                "-map",
+                "[a_out]",
+                "-c:v",
+                nvenc or opts.codec,
+                "-preset",
+                _NVENC_PRESETS.get(opts.preset, "p4") if nvenc else opts.preset,
+                "-c:a",
+                opts.audio_codec,
+                "-f",
+                self._video_format.value,
+                "-movflags",
+                movflags,
+            )
+        )
         if opts.target_size_mb is not None and opts.target_size_mb > 0:
             target_bitrate = int((opts.target_size_mb * 8192) / duration_sec) - 128
             target_bitrate = max(100, target_bitrate)
@@ -1453,10 +2459,15 @@ class VideoBuilder:
                     f"{target_bitrate * 2}k",
                 ]
             )
+        elif nvenc:
+            # NVENC has no -crf; constant-quality VBR is the equivalent
+            cmd_parts.extend(["-rc", "vbr", "-cq", str(opts.crf), "-b:v", "0"])
         else:
             cmd_parts.extend(["-crf", str(opts.crf)])
         if opts.audio_bitrate:
             cmd_parts.extend(["-b:a", opts.audio_bitrate])
+        if opts.threads is not None:
+            cmd_parts.extend(["-threads", str(opts.threads)])
         return cmd_parts
 
     def _build_gif_cmd(self) -> list[str]:
@@ -1487,12 +2498,10 @@ class VideoBuilder:
     async def export(self) -> AsyncGenerator[bytes, None]:
         """Build one ffmpeg command with all filters and stream output."""
         if self._gif_options is not None:
-            info = await asyncio.to_thread(
-                lambda: VideoBuilder.get_video_info(self.input_path)
-            )
+            info = await VideoBuilder.get_video_info_async(self.input_path)
             if info.error or info.duration is None:
                 raise RuntimeError(f"Invalid input or no duration: {info.error}")
-            cmd = get_cmd(self._build_gif_cmd())
+            cmd = await get_cmd_async(self._build_gif_cmd())
             total_duration = min(
                 self._gif_options.duration,
                 (info.duration or 0) - _parse_ss_seconds(self._gif_options.start_time),
@@ -1500,71 +2509,195 @@ class VideoBuilder:
             async for chunk in execute(
                 cmd,
                 self.input_path,
-                self._chunk_size,
+                self.chunk_size,
                 complete_callback=self.complete_callback,
                 progress_callback=self.progress_callback,
                 total_duration=max(0, total_duration),
+                max_chunk_size=self._max_chunk_size(),
             ):
                 yield chunk
             return
-        info = await asyncio.to_thread(
-            lambda: VideoBuilder.get_video_info(self.input_path)
-        )
+        info = await self._probe_inputs()
         if info.error or info.duration is None:
             raise RuntimeError(f"Invalid input or no duration: {info.error}")
         if not info.has_audio:
             raise RuntimeError("Input has no audio stream; export requires audio")
-        cmd = get_cmd(self._build(info))
+        script_fd = None
+        # set when a cancelled build is still running in its thread; cleanup is
+        # then left to _discard_prepared, once the thread is done adding files
+        build_running = False
         try:
+            if self._karaoke_segments or self._text_sequences:
+                # rendering and writing the ASS scripts is real work (and these
+                # builds bypass the command cache), so keep it off the event loop
+                prepare = asyncio.ensure_future(
+                    asyncio.to_thread(self._prepare_args, info)
+                )
+                try:
+                    args, script_fd = await asyncio.shield(prepare)
+                except asyncio.CancelledError:
+                    build_running = True
+                    prepare.add_done_callback(self._discard_prepared)
+                    raise
+            else:
+                args, script_fd = self._prepare_args(info)
+            cmd = await get_cmd_async(args)
             async for chunk in execute(
                 cmd,
                 self.input_path,
-                self._chunk_size,
+                self._chunk_size or _pipe_chunk_size(self._estimated_output_size()),
                 complete_callback=self.complete_callback,
                 progress_callback=self.progress_callback,
+                # already probed above; execute() need not probe again
+                total_duration=info.duration,
+                pass_fds=(
+                    *self._ass_fds,
+                    *((script_fd,) if script_fd is not None else ()),
+                ),
+                max_chunk_size=self._max_chunk_size(),
             ):
                 yield chunk
         finally:
-            self._cleanup_ass_files()
+            if script_fd is not None:
+                os.close(script_fd)
+            if not build_running:
+                self._cleanup_ass_files()
+
+    def _prepare_args(self, info: VideoInfo) -> tuple[list[str], Optional[int]]:
+        """The export command, with a long filter graph moved into a script fd."""
+        return _filter_complex_script(self._cached_build(info))
+
+    def _discard_prepared(self, prepare: asyncio.Future) -> None:
+        """Done-callback for a _prepare_args thread whose export was cancelled:
+        close the script fd it returned and the ASS files it wrote."""
+        if not prepare.cancelled() and prepare.exception() is None:
+            _, script_fd = prepare.result()
+            if script_fd is not None:
+                os.close(script_fd)
+        self._cleanup_ass_files()
+
+    def _trim_explicit(self) -> bool:
+        return (
+            self._trim_end is not None and self._trim_end >= 0
+        ) or self._trim_duration is not None
+
+    async def _probe_inputs(self) -> VideoInfo:
+        """Probe the input, and the background audio alongside it when _build needs
+        its duration, so the two ffprobe runs overlap."""
+        if self._transcode is not None and self._transcode.hw_accel != "none":
+            # list the encoders off the event loop; _build then reads the cache
+            await asyncio.to_thread(_ffmpeg_encoders)
+        bg = self._background_audio
+        if bg is None or self._trim_explicit():
+            return await VideoBuilder.get_video_info_async(self.input_path)
+        info, self._media_durations[bg.path] = await asyncio.gather(
+            VideoBuilder.get_video_info_async(self.input_path),
+            _get_media_duration_async(bg.path),
+        )
+        return info
+
+    def _max_chunk_size(self) -> Optional[int]:
+        # an explicit chunk_size is kept fixed; otherwise execute() may grow it
+        return None if self._chunk_size else MAX_CHUNK_SIZE
+
+    def _estimated_output_size(self) -> int:
+        """Rough output size for sizing pipe reads: the requested target size when
+        compressing, else the size of a local input."""
+        opts = self._transcode
+        if opts is not None and opts.target_size_mb:
+            return int(opts.target_size_mb * 1024 * 1024)
+        return _local_size(self.input_path)
+
+    async def export_to(self, sink: Any) -> int:
+        """Run export and stream the output into sink (StreamWriter, object with a
+        sync/async write, or a callable) without collecting it. Returns bytes written.
+        """
+        return await _drain_to_sink(self.export(), sink)
+
+    async def export_to_file(self, path: str) -> int:
+        """Run export and write the output to path. Returns bytes written."""
+        return await _drain_to_file(self.export(), path)
 
-    async def export_to_bytes(self) -> bytes:
-        """Run export and return the whole output as bytes (full video in memory)."""
-        result = bytearray()
-        async for chunk in self.export():
-            result.extend(chunk)
-        return bytes(result)
+    async def export_to_view(self) -> memoryview:
+        """Run export and return the output as a memoryview. It is collected with the
+        same single join as export_to_bytes; only later slices of the view avoid copies.
+        """
+        return await _drain_to_view(self.export())
+
+    async def export_to_bytes(
+        self, backing: Literal["ram", "mmap"] = "ram"
+    ) -> Union[bytes, memoryview]:
+        """Run export and return the whole output as bytes (full video in memory).
+        backing="mmap" writes the output to a temp file instead and returns a
+        read-only memoryview of its mapping, for outputs too large to hold in RAM.
+        Prefer export_to_file or export_to when the output ends up on disk or a socket.
+        """
+        if backing == "mmap":
+            return await _drain_to_mmap(self.export())
+        return await _drain_to_bytes(self.export())
 
     async def extract_audio(self) -> AsyncGenerator[bytes, None]:
         """Extract audio using builder trim/speed and constructor audio_format/audio_bitrate. Streams chunks."""
-        info = await asyncio.to_thread(
-            lambda: VideoBuilder.get_video_info(self.input_path)
-        )
+        info = await VideoBuilder.get_video_info_async(self.input_path)
         if info.error or info.duration is None:
             raise RuntimeError(f"Invalid input or no duration: {info.error}")
         if not info.has_audio:
             raise RuntimeError("Input has no audio stream; cannot extract audio")
-        cmd = get_cmd(self._build(info, "extract_audio"))
+        cmd = await get_cmd_async(self._cached_build(info, "extract_audio"))
         async for chunk in execute(
             cmd,
             self.input_path,
-            self._chunk_size,
+            self.chunk_size,
             complete_callback=self.complete_callback,
             progress_callback=self.progress_callback,
+            total_duration=info.duration,
+            max_chunk_size=self._max_chunk_size(),
         ):
             yield chunk
 
+    async def extract_audio_to(self, sink: Any) -> int:
+        """Extract audio and stream it into sink (see export_to). Returns bytes written."""
+        return await _drain_to_sink(self.extract_audio(), sink)
+
     async def extract_audio_to_bytes(self) -> bytes:
         """Extract audio and return the full output as bytes (uses builder trim/speed and constructor audio format)."""
-        result = bytearray()
-        async for chunk in self.extract_audio():
-            result.extend(chunk)
-        return bytes(result)
+        return await _drain_to_bytes(self.extract_audio())
+
+    @staticmethod
+    async def _sum_durations_into(
+        input_paths: list[str], total: list[Optional[float]]
+    ) -> None:
+        """Probe inputs and store their summed duration in total[0] once every probe
+        has finished; until then it stays None. The first bad input cancels the
+        probes still running and is only logged (total stays None); ffmpeg fails
+        on it with its own error."""
+        # probe concurrently, bounded so a long manifest doesn't fork-storm ffprobe
+        probe_sem = asyncio.Semaphore(CONCAT_PROBE_CONCURRENCY)
+
+        async def probe(path: str) -> None:
+            async with probe_sem:
+                info = await VideoBuilder.get_video_info_async(path)
+            if info.error or info.duration is None:
+                raise RuntimeError(
+                    f"Invalid concat input {path!r}: {info.error or 'no duration'}"
+                )
+            durations.append(info.duration)
+
+        durations: list[float] = []
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for p in input_paths:
+                    tg.create_task(probe(p))
+            total[0] = sum(durations)
+        except Exception as e:  # ExceptionGroup from the TaskGroup
+            errors = getattr(e, "exceptions", (e,))
+            logger.warning("; ".join(str(err) for err in errors))
 
     @staticmethod
     async def concat_videos(
         input_paths: list[str],
         video_format: VideoFormat = VideoFormat.MP4,
-        chunk_size: int = 8192,
+        chunk_size: Optional[int] = None,
         complete_callback: Optional[OnCompleteCallback] = None,
         progress_callback: Optional[ProgressCallaback] = None,
     ) -> AsyncGenerator[bytes, None]:
@@ -1573,64 +2706,125 @@ class VideoBuilder:
         """
         if len(input_paths) < 2:
             raise ValueError("concat_videos requires at least 2 input paths")
-        manifest = _build_concat_manifest(input_paths)
-        total_duration = 0.0
-        for path in input_paths:
-            info = await asyncio.to_thread(
-                lambda p=path: VideoBuilder.get_video_info(p)
-            )
-            if info.error or info.duration is None:
-                raise RuntimeError(
-                    f"Invalid input {path!r}: {info.error or 'no duration'}"
-                )
-            total_duration += info.duration or 0.0
-        cmd = get_cmd(
-            [
-                ffmpeg,
-                "-f",
-                "concat",
-                "-safe",
-                "0",
-                "-i",
-                "pipe:0",
-                "-c",
-                "copy",
-                "-f",
-                video_format.value,
-                "-movflags",
-                "+frag_keyframe+empty_moov",
-            ]
+        # large manifests are built off the event loop; below the threshold the
+        # thread hop costs more than the build (~60us per 256 paths)
+        if len(input_paths) >= CONCAT_THREAD_THRESHOLD:
+            manifest = await asyncio.to_thread(_build_concat_manifest, input_paths)
+        else:
+            manifest = _build_concat_manifest(input_paths)
+        # the docker prefix, resolved before anything below needs cleaning up
+        host = await get_cmd_async([])
+        # Durations only feed progress, so ffmpeg starts right away and the inputs
+        # are probed alongside it. Progress is reported once the total is known;
+        # a partial sum would run ahead to 100% while later inputs are probed.
+        total: list[Optional[float]] = [None]
+        probe_task = (
+            asyncio.create_task(VideoBuilder._sum_durations_into(input_paths, total))
+            if progress_callback is not None
+            else None
+        )
+        manifest_fd = _manifest_memfd(manifest)
+        cmd = [
+            *host,
+            ffmpeg,
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            f"/dev/fd/{manifest_fd}" if manifest_fd is not None else "pipe:0",
+            "-c",
+            "copy",
+            "-f",
+            video_format.value,
+            "-movflags",
+            "+frag_keyframe+empty_moov",
+        ]
+        try:
+            async for chunk in execute(
+                cmd,
+                input_paths[0],
+                chunk_size=chunk_size
+                or _pipe_chunk_size(sum(_local_size(p) for p in input_paths)),
+                complete_callback=complete_callback,
+                progress_callback=progress_callback,
+                stdin=manifest if manifest_fd is None else None,
+                total_duration=(lambda: total[0]) if probe_task else None,
+                pass_fds=(manifest_fd,) if manifest_fd is not None else (),
+                max_chunk_size=None if chunk_size else MAX_CHUNK_SIZE,
+            ):
+                yield chunk
+        finally:
+            if probe_task is not None:
+                probe_task.cancel()
+            if manifest_fd is not None:
+                os.close(manifest_fd)
+
+    @staticmethod
+    async def concat_videos_to(
+        input_paths: list[str],
+        sink: Any,
+        video_format: VideoFormat = VideoFormat.MP4,
+        chunk_size: Optional[int] = None,
+        complete_callback: Optional[OnCompleteCallback] = None,
+        progress_callback: Optional[ProgressCallaback] = None,
+    ) -> int:
+        """Concatenate multiple videos and stream the output into sink (see export_to)."""
+        return await _drain_to_sink(
+            VideoBuilder.concat_videos(
+                input_paths,
+                video_format=video_format,
+                chunk_size=chunk_size,
+                complete_callback=complete_callback,
+                progress_callback=progress_callback,
+            ),
+            sink,
+        )
+
+    @staticmethod
+    async def concat_videos_to_file(
+        input_paths: list[str],
+        path: str,
+        video_format: VideoFormat = VideoFormat.MP4,
+        chunk_size: Optional[int] = None,
+        complete_callback: Optional[OnCompleteCallback] = None,
+        progress_callback: Optional[ProgressCallaback] = None,
+    ) -> int:
+        """Concatenate multiple videos and write the output to path. Returns bytes written."""
+        return await _drain_to_file(
+            VideoBuilder.concat_videos(
+                input_paths,
+                video_format=video_format,
+                chunk_size=chunk_size,
+                complete_callback=complete_callback,
+                progress_callback=progress_callback,
+            ),
+            path,
         )
-        async for chunk in execute(
-            cmd,
-            input_paths[0],
-            chunk_size=chunk_size,
-            complete_callback=complete_callback,
-            progress_callback=progress_callback,
-            stdin=manifest,
-            total_duration=total_duration,
-        ):
-            yield chunk
 
     @staticmethod
     async def concat_videos_to_bytes(
         input_paths: list[str],
         video_format: VideoFormat = VideoFormat.MP4,
-        chunk_size: int = 8192,
+        chunk_size: Optional[int] = None,
         complete_callback: Optional[OnCompleteCallback] = None,
         progress_callback: Optional[ProgressCallaback] = None,
-    ) -> bytes:
-        """Concatenate multiple videos and return the full output as bytes."""
-        result = bytearray()
-        async for chunk in VideoBuilder.concat_videos(
+        backing: Literal["ram", "mmap"] = "ram",
+    ) -> Union[bytes, memoryview]:
+        """Concatenate multiple videos and return the full output as bytes.
+        backing="mmap" writes the output to a temp file instead and returns a
+        read-only memoryview of its mapping, for outputs too large to hold in RAM.
+        """
+        chunks = VideoBuilder.concat_videos(
             input_paths,
             video_format=video_format,
             chunk_size=chunk_size,
             complete_callback=complete_callback,
             progress_callback=progress_callback,
-        ):
-            result.extend(chunk)
-        return bytes(result)
+        )
+        if backing == "mmap":
+            return await _drain_to_mmap(chunks)
+        return await _drain_to_bytes(chunks)
 
     def load(self, op: str, data: Any = None, **kwargs):
         """Apply one operation from standardized JSON: {"op": "...", "data": {...}} or data: [...]. No if/else."""
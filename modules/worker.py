@@ -226,15 +226,18 @@ class Worker:
                         )
                     ),
                 )
-                await create(
-                    db,
-                    "files",
-                    **asdict(
-                        BucketFileModel(name=output_filename, bucketname=PRIMARY_BUCKET)
-                    ),
-                )
-
+                # a download-only job's output is the object the downloader already
+                # recorded in files; only new output gets a row of its own
                 if result is not None:
+                    await create(
+                        db,
+                        "files",
+                        **asdict(
+                            BucketFileModel(
+                                name=output_filename, bucketname=PRIMARY_BUCKET
+                            )
+                        ),
+                    )
                     await upload_file(
                         io.BytesIO(result),
                         PRIMARY_BUCKET,
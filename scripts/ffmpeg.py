@@ -1,16 +1,27 @@
 import json, subprocess, re
+import fcntl
 import asyncio
+from collections import deque
 from datetime import datetime
 from typing import Optional, Protocol
 from dataclasses import dataclass
 from .logger import logger
 from datetime import datetime
 from enum import Enum
-from io import BytesIO
 
 ffprobe = "ffprobe"
 ffmpeg = "ffmpeg"
 
+# stdout read size; one large read per wakeup instead of dozens of 8 KiB ones
+CHUNK_SIZE = 256 * 1024
+# StreamReader buffer limit, so long stderr lines never overflow readline
+STREAM_LIMIT = 1 << 20
+# kernel pipe size requested for ffmpeg stdout (Linux F_SETPIPE_SZ)
+PIPE_SIZE = 1 << 20
+
+# -progress key=value line carrying the output position in microseconds
+_OUT_TIME_RE = re.compile(rb"out_time_ms=(\d+)")
+
 
 @dataclass
 class ExecutionResult:
@@ -66,15 +77,23 @@ class AudioFormat(str, Enum):
     FLAC = "flac"
 
 
-def get_progress(total_duration: int, line: str, progress_callback: ProgressCallaback):
-    match = re.search(r"out_time_ms=(\d+)", line)
-    if match:
+def get_progress(
+    total_duration: int, line: bytes, progress_callback: ProgressCallaback
+):
+    if not line.startswith(b"out_time_ms="):
+        return
+    try:
+        current_ms = int(line[12:])
+    except ValueError:
+        match = _OUT_TIME_RE.search(line)
+        if not match:
+            return
         current_ms = int(match.group(1))
-        current_sec = current_ms / 1_000_000
-        progress = (
-            min(100, (current_sec / total_duration) * 100) if total_duration > 0 else 0
-        )
-        progress_callback(progress)
+    current_sec = current_ms / 1_000_000
+    progress = (
+        min(100, (current_sec / total_duration) * 100) if total_duration > 0 else 0
+    )
+    progress_callback(progress)
 
 
 def get_cmd(input: list[str]):
@@ -94,21 +113,23 @@ def get_cmd(input: list[str]):
 async def execute(
     cmd: list[str],
     input: str,
-    chunk_size: int = 8192,
+    chunk_size: int = CHUNK_SIZE,
     complete_callaback: Optional[OnCompleteCallback] = None,
     progress_callback: Optional[ProgressCallaback] = None,
-    stdin: str = None,
+    stdin: Optional[bytes] = None,
 ):
     start_time = datetime.now()
-    video_info: VideoInfo = await asyncio.to_thread(
-        lambda: VideoProcessor.get_video_info(input)
-    )
-    total_duration = video_info.duration
+    # the duration only feeds progress, so skip the ffprobe round trip without it
+    total_duration = None
+    if progress_callback:
+        video_info: VideoInfo = await asyncio.to_thread(
+            VideoProcessor.get_video_info, input
+        )
+        total_duration = video_info.duration or 0
 
     cmd = [
         *cmd,
-        "-progress",
-        "pipe:2",
+        *(("-progress", "pipe:2") if progress_callback else ()),
         "pipe:1",
     ]
 
@@ -118,7 +139,17 @@ async def execute(
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         stdin=asyncio.subprocess.PIPE if stdin else None,
+        limit=STREAM_LIMIT,
     )
+    if hasattr(fcntl, "F_SETPIPE_SZ"):
+        try:
+            fcntl.fcntl(
+                process.stdout._transport.get_extra_info("pipe").fileno(),
+                fcntl.F_SETPIPE_SZ,
+                PIPE_SIZE,
+            )
+        except (AttributeError, OSError):
+            pass
 
     # Write stdin in background if provided
     async def write_stdin():
@@ -130,14 +161,15 @@ async def execute(
 
     stdin_task = asyncio.create_task(write_stdin())
 
-    std_error = []
+    # only the tail is reported on failure
+    std_error: deque[bytes] = deque(maxlen=100)
 
     async def read_stderr():
         while True:
             line = await process.stderr.readline()
             if not line:
                 break
-            line = line.decode(errors="replace").rstrip()
+            # raw bytes: lines are only stripped and decoded if they end up in the error
             std_error.append(line)
             if progress_callback:
                 get_progress(total_duration, line, progress_callback)
@@ -157,7 +189,9 @@ async def execute(
 
         error = None
         if process.returncode != 0:
-            error = std_error[-100:]
+            error = b"\n".join(line.rstrip(b"\r\n") for line in std_error).decode(
+                errors="replace"
+            )
         result = ExecutionResult(
             start_time=start_time,
             end_time=end_time,
@@ -178,7 +212,7 @@ class VideoProcessor:
         self.complete_callaback = complete_callaback
         self.progress_callback = progress_callback
 
-        self._chunk_size = 8192
+        self._chunk_size = CHUNK_SIZE
 
     @staticmethod
     def get_video_info(input: str) -> VideoInfo:
@@ -196,8 +230,9 @@ class VideoProcessor:
             ]
         )
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            result = subprocess.run(cmd, capture_output=True, check=True)
             # a video can contain multiple streams => audio, video,etc
+            # json.loads takes the raw bytes; no separate decode pass
             output = json.loads(result.stdout)
             streams = output.get("streams", [])
             video_stream = next(
@@ -363,9 +398,9 @@ class VideoProcessor:
 
     async def concatenete_videos(self, inputs: list[str], output_codec="mp4"):
         # ffmpeg needs a list of video inputs as continous text
-        manifest_buffer = BytesIO()
-        for input in inputs:
-            manifest_buffer.write(f"file '{input}' \n".encode())
+        esc = lambda p: (p or "").replace("'", "'\\''")
+        manifest = "\n".join(f"file '{esc(p)}'" for p in inputs) + "\n"
+        input = inputs[-1] if inputs else ""
 
         cmd = get_cmd(
             [
@@ -389,7 +424,7 @@ class VideoProcessor:
             cmd,
             input,
             self.chunk_size,
-            stdin=manifest_buffer.read().decode(),
+            stdin=manifest.encode(),
             complete_callaback=self.complete_callaback,
             progress_callback=self.progress_callback,
         ):
@@ -1,6 +1,13 @@
 """Unit tests for VideoBuilder: assert the output ffmpeg commands from _build()."""
 
 import asyncio
+import fcntl
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
 
 import pytest
 
@@ -22,15 +29,49 @@ from modules.video_processor import (
     KaraokeText,
     TextSequence,
     TimedText,
+    execute,
+    _ass_alignment_and_margins,
+    _ass_color,
+    _ass_time,
     _atempo_chain,
+    _auto_word_timings,
+    _split_sentence_words,
+    _word_weight,
     _build_concat_manifest,
+    _drain_to_bytes,
+    _drain_to_view,
+    _drain_to_sink,
+    _drain_to_file,
+    _drain_to_mmap,
+    _filter_complex_script,
     _resolve_end_sec,
     _parse_ss_seconds,
+    _progress_percent,
+    _VIDEO_INFO_CACHE,
+    _MEDIA_DURATION_CACHE,
+    _get_media_duration,
+    _get_media_duration_async,
+    _CONTAINER_IDS,
+    _CONTAINER_LOOKUP_FAILED,
+    _LOOKUP_RETRY_SEC,
+    _forget_container_id,
+    _ffmpeg_encoders,
+    get_cmd,
+    get_cmd_async,
+    reset_env,
 )
 
 # --- Fixtures and helpers ---
 
 
+@pytest.fixture(autouse=True)
+def fresh_env():
+    """CLIPPER_* settings are cached on first use; tests set them per test."""
+    reset_env()
+    yield
+    reset_env()
+
+
 @pytest.fixture
 def default_info() -> VideoInfo:
     """VideoInfo for tests (no real file)."""
@@ -77,6 +118,11 @@ class TestAtempoChain:
     def test_speed_double(self):
         assert _atempo_chain(2.0) == "atempo=2.0"
 
+    def test_int_and_float_speed_render_the_same(self):
+        _atempo_chain.cache_clear()
+        assert _atempo_chain(3) == _atempo_chain(3.0) == "atempo=2.0,atempo=1.5"
+        assert _atempo_chain(1) == "atempo=1.0"
+
     def test_speed_four_chains(self):
         assert _atempo_chain(4.0) == "atempo=2.0,atempo=2.0"
 
@@ -125,6 +171,30 @@ class TestExportNoFilters:
         assert cmd_get(cmd, "-f") == expected_f
 
 
+class TestCachedBuild:
+    def test_reuses_command_for_same_info(self, default_info):
+        b = VideoBuilder("input.mp4").trim(1, 5)
+        with patch.object(b, "_build", wraps=b._build) as build:
+            first = b._cached_build(default_info)
+            second = b._cached_build(info())
+        assert build.call_count == 1
+        assert first == second
+        assert first is not second
+
+    def test_setter_invalidates(self, default_info):
+        b = VideoBuilder("input.mp4")
+        assert "-filter_complex" not in b._cached_build(default_info)
+        b.trim(1, 5)
+        assert b._cached_build(default_info) == b._build(default_info)
+        assert "-filter_complex" in b._cached_build(default_info)
+
+    def test_info_is_part_of_key(self):
+        b = VideoBuilder("input.mp4").trim(1)
+        assert b._cached_build(info(duration=30.0)) != b._cached_build(
+            info(duration=60.0)
+        )
+
+
 # --- Export: trim ---
 
 
@@ -151,6 +221,14 @@ class TestExportTrim:
         assert fc is not None
         assert "trim=start=0:end=30" in fc
 
+    def test_trim_outputs_named_without_pass_through(self, default_info):
+        b = VideoBuilder("input.mp4").trim(start_sec=0, end_sec=10)
+        fc = filter_complex(b._build(default_info))
+        assert "setpts=PTS-STARTPTS[v_out]" in fc
+        assert "asetpts=PTS-STARTPTS[a_out]" in fc
+        assert "setpts=PTS[v_out]" not in fc
+        assert "anull" not in fc
+
 
 # --- Export: text ---
 
@@ -181,6 +259,15 @@ class TestExportText:
         assert "First" in fc and "Second" in fc
         assert ",drawtext=" in fc
 
+    def test_repeated_segments_share_drawtext_opts(self, default_info):
+        seg = TextSegment(start_sec=0, end_sec=5, text="Again")
+        b = VideoBuilder("input.mp4").add_text(
+            [seg, TextSegment(start_sec=0, end_sec=5, text="Again")]
+        )
+        fc = filter_complex(b._build(default_info))
+        assert fc.count("text='Again'") == 2
+        assert hash(seg) == hash(TextSegment(start_sec=0, end_sec=5, text="Again"))
+
     def test_text_with_styling_fontcolor_box(self, default_info):
         b = VideoBuilder("input.mp4").add_text(
             TextSegment(
@@ -215,6 +302,75 @@ class TestExportText:
 # --- Export: karaoke ---
 
 
+class TestAssColor:
+    @pytest.mark.parametrize(
+        "color,expected",
+        [
+            ("yellow", "&H0000FFFF&"),
+            ("#ff8000", "&H000080ff&"),
+            ("0xFF8000@0.5", "&H800080ff&"),
+            ("black@0", "&HFF000000&"),
+            ("nothex", "&H00FFFFFF&"),
+            ("#zzzzzz", "&H00FFFFFF&"),
+            (None, "&H00FFFFFF&"),
+        ],
+    )
+    def test_named_hex_and_alpha(self, color, expected):
+        assert _ass_color(color) == expected
+
+
+class TestAssTime:
+    @pytest.mark.parametrize(
+        "sec,expected",
+        [
+            (0, "0:00:00.00"),
+            (-1.5, "0:00:00.00"),
+            (1.25, "0:00:01.25"),
+            (1.999, "0:00:02.00"),
+            (59.996, "0:01:00.00"),
+            (3725.5, "1:02:05.50"),
+        ],
+    )
+    def test_formats_centiseconds(self, sec, expected):
+        assert _ass_time(sec) == expected
+
+
+class TestAssAlignmentAndMargins:
+    @pytest.mark.parametrize(
+        "x,y,expected",
+        [
+            ("10", "h-150", (2, 10, 20, 150)),
+            ("W-w-20", "20", (8, 20, 20, 20)),
+            ("(w-text_w)/2", "h-12.5", (2, 20, 20, 12)),
+            ("", "h-1x", (2, 20, 20, 200)),
+        ],
+    )
+    def test_positions(self, x, y, expected):
+        assert _ass_alignment_and_margins(x, y) == expected
+
+
+class TestAutoWordTimings:
+    def test_split_on_any_whitespace(self):
+        assert _split_sentence_words("  one\ttwo \n three  ") == ["one", "two", "three"]
+
+    def test_weight_ignores_punctuation(self):
+        assert _word_weight("it's,") == 3
+        assert _word_weight("café!") == 4
+        assert _word_weight("...") == 1
+
+    def test_timings_split_by_weight_and_end_exactly(self):
+        timings = _auto_word_timings("a bbb", 1.0, 5.0)
+        assert [t.word for t in timings] == ["a", "bbb"]
+        assert timings[0].start_sec == 1.0
+        assert timings[0].end_sec == pytest.approx(2.0)
+        assert timings[1].start_sec == timings[0].end_sec
+        assert timings[1].end_sec == 5.0
+
+    def test_no_words_or_no_duration(self):
+        assert _auto_word_timings("   ", 0, 2) == []
+        assert _auto_word_timings("one", 2, 2) == []
+
+
 class TestExportKaraoke:
     def test_karaoke_auto_timings_adds_word_overlays(self, default_info):
         b = VideoBuilder("input.mp4").add_karaoke_text(
@@ -225,6 +381,175 @@ class TestExportKaraoke:
         assert fc is not None
         assert "subtitles=" in fc
 
+    def test_karaoke_script_file_on_host(self, default_info, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        b = VideoBuilder("input.mp4").add_karaoke_text(
+            KaraokeText(sentence="naïve {two}", start_sec=0, end_sec=2)
+        )
+        b._build(default_info)
+        (path,) = b._ass_files_to_cleanup
+        with open(path, encoding="utf-8") as f:
+            script = f.read()
+        assert script.startswith("[Script Info]")
+        assert "naïve" in script and r"\{two\}" in script
+        b._cleanup_ass_files()
+        assert not os.path.exists(path)
+
+    def test_subtitle_scripts_fused_into_one_chain(
+        self, default_info, monkeypatch, tmp_path
+    ):
+        monkeypatch.chdir(tmp_path)
+        b = (
+            VideoBuilder("input.mp4")
+            .add_karaoke_text(KaraokeText(sentence="one", start_sec=0, end_sec=1))
+            .add_karaoke_text(KaraokeText(sentence="two", start_sec=1, end_sec=2))
+            .add_text_sequence(
+                TextSequence(items=[TimedText(text="hi", start_sec=0, end_sec=1)])
+            )
+        )
+        fc = filter_complex(b._build(default_info))
+        b._cleanup_ass_files()
+        (chain,) = [part for part in fc.split(";") if "subtitles=" in part]
+        assert chain.count("subtitles=") == 3
+        # last stage here, so its output is relabelled straight to [v_out]
+        assert chain.startswith("[0:v]subtitles=") and chain.endswith("[v_out]")
+
+    def test_export_renders_scripts_off_the_event_loop(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        b = VideoBuilder("input.mp4").add_karaoke_text(
+            KaraokeText(sentence="one two", start_sec=0, end_sec=2)
+        )
+        threads = []
+        prepare = VideoBuilder._prepare_args
+
+        def spy(self, info):
+            threads.append(threading.get_ident())
+            return prepare(self, info)
+
+        async def probe(path):
+            return VideoInfo(duration=30.0, width=1920, height=1080, has_audio=True)
+
+        async def fake_execute(cmd, *args, **kwargs):
+            assert any("subtitles=" in arg for arg in cmd)
+            yield b"out"
+
+        async def run():
+            return threading.get_ident(), [c async for c in b.export()]
+
+        with (
+            patch.object(VideoBuilder, "get_video_info_async", probe),
+            patch.object(VideoBuilder, "_prepare_args", spy),
+            patch("modules.video_processor.execute", fake_execute),
+        ):
+            loop_thread, chunks = asyncio.run(run())
+        assert chunks == [b"out"]
+        assert threads and threads[0] != loop_thread
+        assert not b._ass_files_to_cleanup and not b._ass_fds
+
+    def test_cancelled_export_releases_what_the_build_thread_made(
+        self, monkeypatch, tmp_path
+    ):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        b = VideoBuilder("input.mp4").add_karaoke_text(
+            KaraokeText(sentence="one two", start_sec=0, end_sec=2)
+        )
+        started, release = threading.Event(), threading.Event()
+        made = []
+        prepare = VideoBuilder._prepare_args
+
+        def slow_prepare(self, info):
+            started.set()
+            release.wait(5)
+            args, _ = prepare(self, info)
+            script_fd = os.open(os.devnull, os.O_RDONLY)
+            made.extend((*self._ass_fds, script_fd))
+            return args, script_fd
+
+        async def probe(path):
+            return VideoInfo(duration=30.0, width=1920, height=1080, has_audio=True)
+
+        def all_closed():
+            for fd in made:
+                try:
+                    os.fstat(fd)
+                except OSError:
+                    continue
+                return False
+            return bool(made)
+
+        async def run():
+            task = asyncio.create_task(b.export().__anext__())
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            release.set()
+            for _ in range(500):
+                if all_closed():
+                    return
+                await asyncio.sleep(0.01)
+
+        with (
+            patch.object(VideoBuilder, "get_video_info_async", probe),
+            patch.object(VideoBuilder, "_prepare_args", slow_prepare),
+        ):
+            asyncio.run(run())
+        assert all_closed()
+        assert not b._ass_files_to_cleanup and not b._ass_fds
+
+    @pytest.mark.skipif(not hasattr(os, "memfd_create"), reason="needs memfd")
+    def test_karaoke_script_in_memfd_when_in_container(self, default_info, monkeypatch):
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        b = VideoBuilder("input.mp4").add_karaoke_text(
+            KaraokeText(sentence="one two", start_sec=0, end_sec=2)
+        )
+        fc = filter_complex(b._build(default_info))
+        (fd,) = b._ass_fds
+        assert f"subtitles='/dev/fd/{fd}'" in fc
+        assert not b._ass_files_to_cleanup
+        assert os.pread(fd, 13, 0) == b"[Script Info]"
+        b._cleanup_ass_files()
+        assert not b._ass_fds
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+    @pytest.mark.skipif(not hasattr(os, "memfd_create"), reason="needs memfd")
+    @pytest.mark.skipif(not hasattr(fcntl, "F_GET_SEALS"), reason="needs seals")
+    def test_karaoke_memfd_is_sealed(self, default_info, monkeypatch):
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        b = VideoBuilder("input.mp4").add_karaoke_text(
+            KaraokeText(sentence="one two", start_sec=0, end_sec=2)
+        )
+        b._build(default_info)
+        (fd,) = b._ass_fds
+        try:
+            assert fcntl.fcntl(fd, fcntl.F_GET_SEALS) & fcntl.F_SEAL_WRITE
+            with pytest.raises(PermissionError):
+                os.write(fd, b"x")
+        finally:
+            b._cleanup_ass_files()
+
+    def test_rendered_script_reused_until_builder_changes(self, default_info):
+        b = VideoBuilder("input.mp4").add_karaoke_text(
+            KaraokeText(sentence="one two", start_sec=0, end_sec=2)
+        )
+        render = VideoBuilder._render_karaoke_ass
+        with patch.object(
+            VideoBuilder, "_render_karaoke_ass", autospec=True, side_effect=render
+        ) as spy:
+            b._build(default_info)
+            b._cleanup_ass_files()
+            b._build(default_info)
+            b._cleanup_ass_files()
+            assert spy.call_count == 1
+            b.add_karaoke_text(KaraokeText(sentence="three", start_sec=2, end_sec=3))
+            b._build(default_info)
+            b._cleanup_ass_files()
+            assert spy.call_count == 3
+
 
 class TestTextSequenceValidation:
     def test_text_sequence_requires_at_least_one_item(self):
@@ -271,6 +596,8 @@ class TestExportSpeed:
         assert fc is not None
         assert "concat=" in fc
         assert "atempo" in fc
+        assert "setpts=(PTS-STARTPTS)/2.0[v_s1]" in fc
+        assert "setpts=PTS-STARTPTS[v_s" not in fc
 
     def test_speed_gt_two_chains_atempo(self, default_info):
         b = VideoBuilder("input.mp4").speed_control(4.0)
@@ -480,6 +807,7 @@ class TestExportBackgroundColor:
         assert fc is not None
         assert "color=c=0x333333" in fc
         assert "[bg]" in fc and "overlay=" in fc
+        assert ";;" not in fc
 
 
 # --- Export: transcode / compress ---
@@ -513,6 +841,78 @@ class TestExportTranscode:
         assert cmd_get(cmd, "-crf") == "18"
         assert cmd_get(cmd, "-b:a") == "192k"
 
+    def test_transcode_threads(self, default_info):
+        cmd = (
+            VideoBuilder("input.mp4")
+            .trim(0, 5)
+            .transcode(threads=0)
+            ._build(default_info)
+        )
+        assert cmd_get(cmd, "-threads") == "0"
+        assert cmd_get(cmd, "-filter_complex_threads") == "0"
+        # global option, so it has to come before the first input
+        assert cmd.index("-filter_complex_threads") < cmd.index("-i")
+
+    def test_transcode_threads_default_unset(self, default_info):
+        cmd = VideoBuilder("input.mp4").trim(0, 5).transcode()._build(default_info)
+        assert "-threads" not in cmd
+        assert "-filter_complex_threads" not in cmd
+
+    def test_nvenc_when_encoder_available(self, default_info, monkeypatch):
+        monkeypatch.setattr(
+            "modules.video_processor._FFMPEG_ENCODERS",
+            frozenset({"libx264", "h264_nvenc"}),
+        )
+        cmd = (
+            VideoBuilder("input.mp4")
+            .trim(0, 5)
+            .transcode(preset="fast", crf=21, hw_accel="nvenc")
+            ._build(default_info)
+        )
+        assert cmd_get(cmd, "-hwaccel") == "cuda"
+        assert cmd.index("-hwaccel") < cmd.index("-i")
+        assert cmd_get(cmd, "-c:v") == "h264_nvenc"
+        assert cmd_get(cmd, "-preset") == "p3"
+        assert cmd_get(cmd, "-cq") == "21"
+        assert "-crf" not in cmd
+
+    def test_nvenc_falls_back_to_software(self, default_info, monkeypatch):
+        monkeypatch.setattr(
+            "modules.video_processor._FFMPEG_ENCODERS", frozenset({"libx264"})
+        )
+        cmd = (
+            VideoBuilder("input.mp4")
+            .trim(0, 5)
+            .transcode(hw_accel="nvenc")
+            ._build(default_info)
+        )
+        assert "-hwaccel" not in cmd
+        assert cmd_get(cmd, "-c:v") == "libx264"
+        assert cmd_get(cmd, "-crf") == "23"
+
+    def test_nvenc_build_never_lists_encoders(self, default_info, monkeypatch):
+        monkeypatch.setattr("modules.video_processor._FFMPEG_ENCODERS", None)
+        with patch("modules.video_processor.subprocess.run") as run:
+            cmd = (
+                VideoBuilder("input.mp4")
+                .trim(0, 5)
+                .transcode(hw_accel="nvenc")
+                ._build(default_info)
+            )
+        run.assert_not_called()
+        assert cmd_get(cmd, "-c:v") == "libx264"
+
+    def test_failed_encoder_listing_not_retried_at_once(self, monkeypatch):
+        monkeypatch.setattr("modules.video_processor._FFMPEG_ENCODERS", None)
+        monkeypatch.setattr("modules.video_processor._ENCODERS_LOOKUP_FAILED", None)
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        with patch(
+            "modules.video_processor.subprocess.run", side_effect=FileNotFoundError
+        ) as run:
+            assert _ffmpeg_encoders() == frozenset()
+            assert _ffmpeg_encoders() == frozenset()
+        assert run.call_count == 1
+
     def test_compress_target_size_mb(self, default_info):
         b = VideoBuilder("input.mp4").trim(0, 10).compress(target_size_mb=5.0)
         cmd = b._build(info(duration=30.0))
@@ -762,16 +1162,16 @@ class TestGifBuild:
 class TestConcatManifest:
     def test_manifest_two_paths(self):
         manifest = _build_concat_manifest(["a.mp4", "b.mp4"])
-        lines = manifest.strip().split("\n")
+        lines = manifest.strip().split(b"\n")
         assert len(lines) == 2
-        assert lines[0] == "file 'a.mp4'"
-        assert lines[1] == "file 'b.mp4'"
-        assert manifest.endswith("\n")
+        assert lines[0] == b"file 'a.mp4'"
+        assert lines[1] == b"file 'b.mp4'"
+        assert manifest.endswith(b"\n")
 
     def test_manifest_escapes_single_quotes(self):
         manifest = _build_concat_manifest(["path/with'quote.mp4"])
-        assert "file '" in manifest
-        assert "''" in manifest or "'\\''" in manifest
+        assert b"file '" in manifest
+        assert b"''" in manifest or b"'\\''" in manifest
 
 
 class TestConcatVideos:
@@ -786,3 +1186,494 @@ class TestConcatVideos:
 
         with pytest.raises(ValueError, match="at least 2"):
             asyncio.run(run())
+
+    @staticmethod
+    async def fake_probe(path):
+        if path == "bad.mp4":
+            return VideoInfo(error="missing")
+        await asyncio.sleep(0.01 if path == "slow.mp4" else 0)
+        return VideoInfo(duration=10.0)
+
+    def test_total_only_set_once_every_probe_is_done(self):
+        async def run():
+            total = [None]
+            task = asyncio.create_task(
+                VideoBuilder._sum_durations_into(["a.mp4", "slow.mp4"], total)
+            )
+            await asyncio.sleep(0)
+            assert total[0] is None
+            await task
+            return total[0]
+
+        with patch.object(VideoBuilder, "get_video_info_async", self.fake_probe):
+            assert asyncio.run(run()) == 20.0
+
+    def test_bad_input_leaves_total_unknown(self):
+        total = [None]
+        with patch.object(VideoBuilder, "get_video_info_async", self.fake_probe):
+            asyncio.run(VideoBuilder._sum_durations_into(["a.mp4", "bad.mp4"], total))
+        assert total[0] is None
+
+
+class TestExecuteChunkSize:
+    # stands in for ffmpeg: writes 8 MiB to stdout, ignoring the appended flags
+    PRODUCER = [
+        sys.executable,
+        "-c",
+        "import sys; sys.stdout.buffer.write(bytes(8 << 20))",
+    ]
+
+    @staticmethod
+    async def sizes(cmd, delay, **kwargs):
+        out = []
+        async for chunk in execute(cmd, "x", 64 * 1024, **kwargs):
+            out.append(len(chunk))
+            await asyncio.sleep(delay)
+        return out
+
+    def test_fixed_without_max(self):
+        sizes = asyncio.run(self.sizes(self.PRODUCER, 0.001))
+        assert sum(sizes) == 8 << 20
+        assert max(sizes) <= 64 * 1024
+
+    def test_grows_while_consumer_lags(self):
+        sizes = asyncio.run(self.sizes(self.PRODUCER, 0.001, max_chunk_size=1 << 20))
+        assert sum(sizes) == 8 << 20
+        assert 64 * 1024 < max(sizes) <= 1 << 20
+
+
+class TestExecuteCallbackErrors:
+    @staticmethod
+    def run(code):
+        # stands in for ffmpeg: prints one progress block and exits with code
+        cmd = [
+            sys.executable,
+            "-c",
+            "import sys; sys.stderr.write('out_time_ms=1000000\\nprogress=end\\n');"
+            f" sys.exit({code})",
+        ]
+
+        async def progress(percent):
+            raise ValueError("callback failed")
+
+        async def drain():
+            async for _ in execute(
+                cmd, "x", progress_callback=progress, total_duration=10.0
+            ):
+                pass
+
+        asyncio.run(drain())
+
+    def test_ffmpeg_failure_wins_over_callback_error(self):
+        with pytest.raises(RuntimeError, match="exited with code 3"):
+            self.run(3)
+
+    def test_callback_error_raised_after_success(self):
+        with pytest.raises(ValueError, match="callback failed"):
+            self.run(0)
+
+
+class TestProgressPercent:
+    @pytest.mark.parametrize(
+        "data,expected",
+        [
+            (b"frame=1\nout_time_ms=5000000\nprogress=continue\n", 50.0),
+            (b"out_time_ms=2000000", 20.0),
+            (b"out_time_ms=1000000\nout_time_ms=N/A\n", 10.0),
+            (b"out_time_ms=N/A\n", None),
+            (b"out_time_us=5000000\n", None),
+            (b"out_time_ms=99000000\n", 100),
+        ],
+    )
+    def test_last_out_time(self, data, expected):
+        assert _progress_percent(10.0, data) == expected
+
+
+class TestDrainToBytes:
+    def test_joins_chunks_in_order(self):
+        async def chunks():
+            for i in range(20):
+                yield bytes([i]) * 300
+            # split chunks from execute() arrive as memoryview windows
+            yield memoryview(b"tail")[1:]
+
+        out = asyncio.run(_drain_to_bytes(chunks()))
+        assert out == b"".join(bytes([i]) * 300 for i in range(20)) + b"ail"
+
+    def test_empty_stream(self):
+        async def chunks():
+            return
+            yield
+
+        assert asyncio.run(_drain_to_bytes(chunks())) == b""
+
+    def test_view_covers_only_written_bytes(self):
+        async def chunks():
+            yield b"abc"
+            yield b"def"
+
+        view = asyncio.run(_drain_to_view(chunks()))
+        assert isinstance(view, memoryview)
+        assert view.tobytes() == b"abcdef"
+
+
+class TestDrainToSink:
+    @staticmethod
+    async def chunks():
+        for part in (b"ab", b"cd", b"e"):
+            yield part
+
+    def test_file_like_sink(self):
+        sink = io.BytesIO()
+        assert asyncio.run(_drain_to_sink(self.chunks(), sink)) == 5
+        assert sink.getvalue() == b"abcde"
+
+    def test_async_write_sink(self):
+        class Sink:
+            def __init__(self):
+                self.parts = []
+
+            async def write(self, chunk):
+                self.parts.append(chunk)
+
+        sink = Sink()
+        asyncio.run(_drain_to_sink(self.chunks(), sink))
+        assert sink.parts == [b"ab", b"cd", b"e"]
+
+    def test_callable_sink(self):
+        parts = []
+
+        async def sink(chunk):
+            parts.append(chunk)
+
+        asyncio.run(_drain_to_sink(self.chunks(), sink))
+        assert b"".join(parts) == b"abcde"
+
+    def test_unsupported_sink(self):
+        with pytest.raises(TypeError, match="Unsupported sink"):
+            asyncio.run(_drain_to_sink(self.chunks(), object()))
+
+
+class TestDrainToFile:
+    def test_writes_all_chunks_in_batches(self, tmp_path):
+        parts = [bytes([i]) * 1000 for i in range(150)]
+
+        async def chunks():
+            for part in parts:
+                yield part
+
+        path = tmp_path / "out.bin"
+        assert asyncio.run(_drain_to_file(chunks(), str(path))) == 150_000
+        assert path.read_bytes() == b"".join(parts)
+
+    def test_resumes_after_short_writev(self, tmp_path):
+        real_writev = os.writev
+
+        def short_writev(fd, bufs):
+            return real_writev(fd, [memoryview(bufs[0])[:3]])
+
+        async def chunks():
+            yield b"hello"
+            yield b"world"
+
+        path = tmp_path / "out.bin"
+        with patch("modules.video_processor.os.writev", side_effect=short_writev):
+            asyncio.run(_drain_to_file(chunks(), str(path)))
+        assert path.read_bytes() == b"helloworld"
+
+
+class TestDrainToMmap:
+    def test_maps_output_and_removes_temp_file(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+        async def chunks():
+            yield b"hello"
+            yield b"world"
+
+        view = asyncio.run(_drain_to_mmap(chunks()))
+        assert view.readonly
+        assert view.tobytes() == b"helloworld"
+        assert list(tmp_path.iterdir()) == []
+
+    def test_empty_output(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+        async def chunks():
+            return
+            yield
+
+        assert asyncio.run(_drain_to_mmap(chunks())).tobytes() == b""
+        assert list(tmp_path.iterdir()) == []
+
+    def test_export_to_bytes_mmap_backing(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+        async def export(self):
+            yield b"video"
+
+        with patch.object(VideoBuilder, "export", export):
+            b = VideoBuilder("input.mp4")
+            view = asyncio.run(b.export_to_bytes(backing="mmap"))
+            assert isinstance(view, memoryview)
+            assert view.tobytes() == b"video"
+            assert asyncio.run(b.export_to_bytes()) == b"video"
+
+
+class TestFilterComplexScript:
+    def test_short_graph_stays_inline(self, monkeypatch):
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        cmd = ["ffmpeg", "-filter_complex", "[0:v]null[v_out]"]
+        assert _filter_complex_script(cmd) == (cmd, None)
+
+    @pytest.mark.skipif(not hasattr(os, "memfd_create"), reason="needs memfd")
+    def test_long_graph_moves_to_memfd(self, monkeypatch):
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        graph = ";".join(["[0:v]null[v]"] * 1000)
+        cmd, fd = _filter_complex_script(
+            ["ffmpeg", "-filter_complex", graph, "-map", "[v_out]"]
+        )
+        try:
+            assert cmd == [
+                "ffmpeg",
+                "-filter_complex_script",
+                f"/dev/fd/{fd}",
+                "-map",
+                "[v_out]",
+            ]
+            assert os.pread(fd, len(graph) + 1, 0) == graph.encode()
+        finally:
+            os.close(fd)
+
+    def test_long_graph_inline_on_host(self, monkeypatch):
+        monkeypatch.delenv("CLIPPER_ENV", raising=False)
+        cmd = ["ffmpeg", "-filter_complex", "x" * 10000]
+        assert _filter_complex_script(cmd) == (cmd, None)
+
+
+# --- get_video_info cache ---
+
+
+class TestVideoInfoCache:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        _VIDEO_INFO_CACHE.clear()
+        yield
+        _VIDEO_INFO_CACHE.clear()
+
+    def test_local_file_probed_once(self, tmp_path):
+        path = tmp_path / "in.mp4"
+        path.write_bytes(b"data")
+        probed = VideoInfo(duration=30.0, width=1920, height=1080)
+        with patch.object(
+            VideoBuilder, "_probe_video_info", return_value=probed
+        ) as probe:
+            assert VideoBuilder.get_video_info(str(path)) is probed
+            assert VideoBuilder.get_video_info(str(path)) is probed
+        assert probe.call_count == 1
+
+    def test_changed_file_probed_again(self, tmp_path):
+        path = tmp_path / "in.mp4"
+        path.write_bytes(b"data")
+        probed = VideoInfo(duration=30.0)
+        with patch.object(
+            VideoBuilder, "_probe_video_info", return_value=probed
+        ) as probe:
+            VideoBuilder.get_video_info(str(path))
+            path.write_bytes(b"longer data")
+            VideoBuilder.get_video_info(str(path))
+        assert probe.call_count == 2
+
+    def test_errors_and_remote_inputs_not_cached(self, tmp_path):
+        path = tmp_path / "in.mp4"
+        path.write_bytes(b"data")
+        with patch.object(
+            VideoBuilder, "_probe_video_info", return_value=VideoInfo(error="bad")
+        ) as probe:
+            VideoBuilder.get_video_info(str(path))
+            VideoBuilder.get_video_info(str(path))
+            VideoBuilder.get_video_info("http://example.com/in.mp4")
+            VideoBuilder.get_video_info("http://example.com/in.mp4")
+        assert probe.call_count == 4
+        assert not _VIDEO_INFO_CACHE
+
+    def test_async_probe_shares_cache(self, tmp_path):
+        path = tmp_path / "in.mp4"
+        path.write_bytes(b"data")
+        probed = VideoInfo(duration=30.0)
+
+        async def fake_probe(_path):
+            return probed
+
+        with patch.object(
+            VideoBuilder, "_probe_video_info_async", side_effect=fake_probe
+        ) as probe:
+            assert asyncio.run(VideoBuilder.get_video_info_async(str(path))) is probed
+            assert VideoBuilder.get_video_info(str(path)) is probed
+        assert probe.call_count == 1
+
+
+class TestMediaDurationCache:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        _MEDIA_DURATION_CACHE.clear()
+        yield
+        _MEDIA_DURATION_CACHE.clear()
+
+    def test_local_file_probed_once(self, tmp_path):
+        path = tmp_path / "bg.mp3"
+        path.write_bytes(b"data")
+        with patch(
+            "modules.video_processor._probe_media_duration", return_value=12.5
+        ) as probe:
+            assert _get_media_duration(str(path)) == 12.5
+            assert _get_media_duration(str(path)) == 12.5
+        assert probe.call_count == 1
+
+    def test_failures_not_cached(self, tmp_path):
+        path = tmp_path / "bg.mp3"
+        path.write_bytes(b"data")
+        with patch(
+            "modules.video_processor._probe_media_duration",
+            side_effect=[RuntimeError("ffprobe failed"), 12.5],
+        ):
+            assert _get_media_duration(str(path)) == 0.0
+            assert _get_media_duration(str(path)) == 12.5
+
+    def test_async_probe_shares_cache(self, tmp_path):
+        path = tmp_path / "bg.mp3"
+        path.write_bytes(b"data")
+
+        async def fake_probe(_path):
+            return 12.5
+
+        with patch(
+            "modules.video_processor._probe_media_duration_async",
+            side_effect=fake_probe,
+        ) as probe:
+            assert asyncio.run(_get_media_duration_async(str(path))) == 12.5
+            assert _get_media_duration(str(path)) == 12.5
+        assert probe.call_count == 1
+
+    def test_export_probes_background_audio_alongside_input(self):
+        b = VideoBuilder("input.mp4").add_background_audio(path="long_music.mp3")
+        started = []
+
+        async def probe_video(path):
+            started.append(path)
+            await asyncio.sleep(0)
+            assert "long_music.mp3" in started
+            return VideoInfo(duration=30.0, width=1920, height=1080)
+
+        async def probe_audio(path):
+            started.append(path)
+            return 60.0
+
+        with (
+            patch.object(VideoBuilder, "get_video_info_async", probe_video),
+            patch("modules.video_processor._get_media_duration_async", probe_audio),
+            patch(
+                "modules.video_processor._get_media_duration",
+                side_effect=AssertionError("probed again"),
+            ),
+        ):
+            info = asyncio.run(b._probe_inputs())
+            fc = filter_complex(b._cached_build(info))
+        assert "stop_duration=30" in fc
+
+
+class TestGetCmd:
+    @pytest.fixture(autouse=True)
+    def host(self, monkeypatch):
+        monkeypatch.delenv("CLIPPER_ENV", raising=False)
+        monkeypatch.setenv("CLIPPER_CONTAINER_NAME", "clipper")
+        _CONTAINER_IDS.clear()
+        _CONTAINER_LOOKUP_FAILED.clear()
+        yield
+        _CONTAINER_IDS.clear()
+        _CONTAINER_LOOKUP_FAILED.clear()
+
+    def test_production_runs_directly(self, monkeypatch):
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        assert get_cmd(["ffmpeg", "-i", "in.mp4"]) == ["ffmpeg", "-i", "in.mp4"]
+
+    def test_host_uses_resolved_container_once(self):
+        ps = subprocess.CompletedProcess([], 0, stdout=b"abc123\n")
+        with patch("modules.video_processor.subprocess.run", return_value=ps) as run:
+            assert get_cmd(["ffprobe", "x"]) == [
+                "docker",
+                "exec",
+                "-i",
+                "abc123",
+                "ffprobe",
+                "x",
+            ]
+            get_cmd(["ffmpeg"])
+        assert run.call_count == 1
+
+    def test_falls_back_to_compose_exec_until_resolved(self):
+        with patch(
+            "modules.video_processor.subprocess.run", side_effect=FileNotFoundError
+        ):
+            cmd = get_cmd(["ffmpeg"])
+        assert cmd[:3] == ["docker", "compose", "exec"]
+        assert not _CONTAINER_IDS
+
+    def test_failed_lookup_retried_after_a_while(self):
+        with patch(
+            "modules.video_processor.subprocess.run", side_effect=FileNotFoundError
+        ) as run:
+            get_cmd(["ffmpeg"])
+            get_cmd(["ffmpeg"])
+            assert run.call_count == 1
+            later = time.monotonic() + _LOOKUP_RETRY_SEC + 1
+            with patch("modules.video_processor.time.monotonic", return_value=later):
+                get_cmd(["ffmpeg"])
+        assert run.call_count == 2
+
+    def test_removed_container_drops_its_id(self):
+        old = subprocess.CompletedProcess([], 0, stdout=b"abc123\n")
+        new = subprocess.CompletedProcess([], 0, stdout=b"def456\n")
+        with patch("modules.video_processor.subprocess.run", side_effect=[old, new]):
+            cmd = get_cmd(["ffmpeg"])
+            _forget_container_id(
+                cmd, "Error response from daemon: No such container: abc123"
+            )
+            assert get_cmd(["ffmpeg"])[3] == "def456"
+
+    def test_ffmpeg_failure_keeps_container_id(self):
+        ps = subprocess.CompletedProcess([], 0, stdout=b"abc123\n")
+        with patch("modules.video_processor.subprocess.run", return_value=ps) as run:
+            cmd = get_cmd(["ffmpeg"])
+            _forget_container_id(cmd, "in.mp4: No such file or directory")
+            assert get_cmd(["ffmpeg"])[3] == "abc123"
+        assert run.call_count == 1
+
+    def test_async_lookup_does_not_block(self):
+        class Process:
+            returncode = 0
+
+            async def communicate(self):
+                return b"abc123\n", b""
+
+        async def spawn(*cmd, **kwargs):
+            assert cmd == ("docker", "compose", "ps", "-q", "clipper")
+            return Process()
+
+        with (
+            patch("modules.video_processor.subprocess.run") as run,
+            patch("asyncio.create_subprocess_exec", spawn),
+        ):
+            cmd = asyncio.run(get_cmd_async(["ffmpeg"]))
+        run.assert_not_called()
+        assert cmd == ["docker", "exec", "-i", "abc123", "ffmpeg"]
+
+    def test_env_read_once_until_reset(self, monkeypatch):
+        monkeypatch.setenv("CLIPPER_ENV", "production")
+        assert get_cmd(["ffmpeg"]) == ["ffmpeg"]
+        monkeypatch.delenv("CLIPPER_ENV")
+        assert get_cmd(["ffmpeg"]) == ["ffmpeg"]
+        reset_env()
+        with patch(
+            "modules.video_processor.subprocess.run", side_effect=FileNotFoundError
+        ):
+            assert get_cmd(["ffmpeg"])[0] == "docker"